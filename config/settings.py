@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -23,6 +24,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-yx$w&te7i4-a=t*mwnl^yo0&%r(6sx&x3=eb1@psg0qrret33s'
 
+# Key for the card_number_hash lookup index (main.fields.pan_hash). Kept apart
+# from SECRET_KEY so rotating that does not orphan every stored hash; after
+# changing this one, run `manage.py backfill_card_index` to rehash the cards.
+CARD_HASH_KEY = os.environ.get('CARD_HASH_KEY', 'django-insecure-card-hash-3k9v$1q7z@w2m^p8r5t0x4n6b')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -47,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,7 +96,7 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication', 
+        'main.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated', 
@@ -105,17 +112,55 @@ SIMPLE_JWT = {
     'UPDATE_LAST_LOGIN': False,
 }
 
-DATABASES = {
-    'default': {
+# CachedJWTAuthentication: verified tokens and users are kept until the token
+# expires. JWT_AUTH_CLAIMS_ONLY builds request.user from the token alone.
+JWT_AUTH_CACHE_SIZE = 50000
+JWT_AUTH_CLAIMS_ONLY = False
+
+# Connection settings come from the environment. DB_CONN_MAX_AGE keeps
+# connections open between requests; DB_POOL=1 uses a psycopg connection pool
+# instead (needs psycopg[pool]; Django forbids combining it with
+# CONN_MAX_AGE). Setting DB_REPLICA_HOST adds a 'replica' alias that the
+# list/get views read from through main.routers.ReplicaRouter.
+#
+# Connections are per thread, and the async payment view runs its work with
+# sync_to_async(thread_sensitive=False), i.e. on whichever executor thread is
+# free. That view closes the worker's connection after each payment the way
+# Django does for a request thread, so with DB_CONN_MAX_AGE > 0 every
+# executor thread keeps one idle connection open; under ASGI prefer DB_POOL=1
+# or leave DB_CONN_MAX_AGE at 0.
+DB_POOL = os.environ.get('DB_POOL', '') in ('1', 'true', 'yes')
+
+
+def _database(prefix, **defaults):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'payment',
-        'USER': 'postgres',
-        'PASSWORD': '1',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get(f'{prefix}NAME', defaults.get('NAME', 'payment')),
+        'USER': os.environ.get(f'{prefix}USER', defaults.get('USER', 'postgres')),
+        'PASSWORD': os.environ.get(f'{prefix}PASSWORD', defaults.get('PASSWORD', '1')),
+        'HOST': os.environ.get(f'{prefix}HOST', defaults.get('HOST', 'localhost')),
+        'PORT': os.environ.get(f'{prefix}PORT', defaults.get('PORT', '5432')),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DB_POOL:
+        database['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }}
+    return database
+
+
+DATABASES = {
+    'default': _database('DB_'),
 }
 
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _database('DB_REPLICA_', **DATABASES['default'])
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -159,9 +204,75 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'main.User'
 
+# Idempotency-Key replay window for POST /api/transactions/create/
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_CACHE_SIZE = 10000
+
+# Merchant/MerchantCategory read-through cache. Set CATALOG_CACHE_ALIAS to a
+# name in CACHES to share entries, table versions (ETags) and rendered
+# responses between processes.
+CATALOG_CACHE_ALIAS = None
+CATALOG_CACHE_SIZE = 4096
+CATALOG_CACHE_TTL = 60
+CATALOG_SHARED_CACHE_TTL = 3600
+
 # Twilio settings
 TWILIO_ACCOUNT_SID = 'your_twilio_account_sid'
 TWILIO_AUTH_TOKEN = 'your_twilio_auth_token'
 TWILIO_PHONE_NUMBER = 'your_twilio_phone_number'
 
-
+# SMS dispatch. Swap SMS_TRANSPORT for 'main.sms.InMemoryTransport' to keep
+# messages off the network.
+SMS_TRANSPORT = 'main.sms.TwilioTransport'
+SMS_QUEUE_SIZE = 10000
+SMS_WORKERS = 8
+SMS_BATCH_SIZE = 20
+SMS_RATE_PER_SECOND = 50
+SMS_MAX_ATTEMPTS = 5
+
+# Instrumentation. /metrics/ is only served to METRICS_ALLOWED_IPS.
+# PROFILE_SAMPLE_RATE=0.01 profiles one request in a hundred and keeps the
+# PROFILE_KEEP_SLOWEST slowest cProfile dumps in PROFILE_DIR. Profiling only
+# runs when served under WSGI; query counts and DB time are recorded either way.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_KEEP_SLOWEST = 20
+
+# Fraud velocity checks on POST /api/transactions/create/. Use
+# 'main.fraud.CacheBackend' with FRAUD_CACHE_ALIAS to share counters between
+# processes; FRAUD_RULES overrides thresholds from main.fraud.DEFAULT_RULES.
+FRAUD_CHECKS_ENABLED = True
+FRAUD_BACKEND = 'main.fraud.MemoryBackend'
+FRAUD_CACHE_ALIAS = 'default'
+FRAUD_RULES = {}
+
+# Token-bucket rate limits on the payment endpoints, per user, client IP and
+# merchant, plus bulk_items for the items of bulk requests per user:
+# RATE_LIMITS maps each scope to (tokens per second, burst) over
+# main.throttling.DEFAULT_LIMITS. Use 'main.throttling.CacheBackend' with
+# RATE_LIMIT_CACHE_ALIAS to share buckets between processes.
+RATE_LIMITS_ENABLED = True
+RATE_LIMIT_BACKEND = 'main.throttling.MemoryBackend'
+RATE_LIMIT_CACHE_ALIAS = 'default'
+RATE_LIMITS = {}
+
+# Payments running at once per process; more get 503 after waiting up to
+# PAYMENT_ADMISSION_TIMEOUT seconds for a slot. Keep it at or below the
+# connections each process can hold. None disables admission control.
+PAYMENT_MAX_IN_FLIGHT = 32
+PAYMENT_ADMISSION_TIMEOUT = 0.05
+
+# Which card funds a payment when the request names none: 'highest_balance',
+# 'first', or 'card_type' (with card_type in the request). Requests may
+# override it with card_policy, card_id, card_type and split.
+CARD_ROUTING_POLICY = 'highest_balance'
+
+# Write-behind for POST /api/transactions/create/ (PostgreSQL only). The
+# request reserves the balance and returns 202; the row is queued in
+# TRANSACTION_QUEUE_PATH on local disk and bulk-inserted by a background writer.
+TRANSACTION_WRITE_BEHIND = False
+TRANSACTION_QUEUE_PATH = BASE_DIR / 'var' / 'transaction-queue.sqlite3'
+TRANSACTION_QUEUE_BATCH_SIZE = 1000
+TRANSACTION_QUEUE_FLUSH_INTERVAL = 0.2
+TRANSACTION_QUEUE_GRACE = 300
@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .catalog import catalog
+        from .metrics import registry
+        from .sms import get_dispatcher
+        from .throttling import in_flight
+        from .writebehind import backlog
+
+        registry.register_gauge('catalog_cache_lookups', 'Merchant catalogue cache hits and misses.',
+                                lambda: {'hit': catalog.hits, 'miss': catalog.misses})
+        registry.register_gauge('sms_queue_pending', 'SMS messages waiting for a worker.',
+                                lambda: get_dispatcher().pending())
+        registry.register_gauge('transaction_queue_backlog', 'Write-behind transactions not yet in the database.',
+                                backlog)
+        registry.register_gauge('payments_in_flight', 'Payments holding an admission slot.', in_flight)
@@ -0,0 +1,185 @@
+import json
+from functools import wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import fast_serializers, ledger
+from .authentication import cached_token, cached_user, claims_only, remember_token, remember_user, user_from_claims
+from .idempotency import run_once
+from .models import ArchivedTransaction, Card, Transaction, User
+from .pagination import InvalidCursor, aiter_ndjson, akeyset_page, filter_transactions, get_fieldset, get_page_size
+from .routers import read_from_replica
+from .serializers import CardSerializer, TransactionSerializer
+from .throttling import payment_admission
+from .views import _create_transaction
+
+
+# Async-native counterparts of the hot endpoints in views.py. They run directly
+# on the ASGI event loop instead of being pushed through a thread per request.
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """
+    Resolve the Bearer token on request to an active User, or None.
+    """
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    token = cached_token(parts[1])
+    try:
+        if token is None:
+            token = AccessToken(parts[1])
+            remember_token(parts[1], token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+    if claims_only():
+        return user_from_claims(user_id)
+    user = cached_user(user_id)
+    if user is None:
+        user = await User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None:
+            return None
+        remember_user(user, token)
+    return user if user.is_active else None
+
+
+def _on_worker(func):
+    """
+    Wrap func for sync_to_async(thread_sensitive=False).
+
+    Django only runs close_old_connections on the thread handling the request,
+    so a worker thread's connection would otherwise never be health-checked,
+    recycled after CONN_MAX_AGE or closed.
+    """
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapped
+
+
+def _unauthorized():
+    return _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+@csrf_exempt
+@require_POST
+async def create_transaction(request):
+    """
+    Create a new transaction.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json({'error': 'Invalid JSON body.'}, status=400)
+    if not isinstance(data, dict):
+        return _json({'error': 'Invalid JSON body.'}, status=400)
+
+    # Validation, the debit and the idempotency record share one database
+    # transaction, which Django only offers to sync code. thread_sensitive=False
+    # lets concurrent payments use separate threads and connections.
+    # Admission runs in that thread too, so waiting for a slot never blocks the event loop.
+    payment_request = SimpleNamespace(user=user, data=data, headers=request.headers, META=request.META)
+    response = await sync_to_async(_on_worker(payment_admission(run_once)), thread_sensitive=False)(
+        payment_request, _create_transaction)
+    json_response = _json(response.data, status=response.status_code)
+    if response.has_header('Retry-After'):
+        json_response['Retry-After'] = response['Retry-After']
+    return json_response
+
+
+@require_GET
+@read_from_replica
+async def get_transaction(request, pk):
+    """
+    Get a transaction by ID.
+    """
+    if await authenticate(request) is None:
+        return _unauthorized()
+    fields, expand = get_fieldset(request.GET)
+    try:
+        serializer = TransactionSerializer(fields=fields, expand=expand)
+    except ValueError as e:
+        return _json({'error': str(e)}, status=400)
+    serializer.instance = (
+        await TransactionSerializer.optimize(Transaction.objects.filter(pk=pk), fields, expand).afirst()
+        or await TransactionSerializer.optimize(ArchivedTransaction.objects.filter(pk=pk), fields, expand).afirst()
+    )
+    if serializer.instance is None:
+        return _json({'error': 'Transaction not found'}, status=404)
+    return _json(serializer.data)
+
+
+@require_GET
+@read_from_replica
+async def list_transactions(request):
+    """
+    List transactions newest first; same parameters as views.list_transactions.
+    """
+    if await authenticate(request) is None:
+        return _unauthorized()
+    fields, expand = get_fieldset(request.GET)
+    try:
+        transactions = filter_transactions(Transaction.objects.all(), request.GET)
+        archived = filter_transactions(ArchivedTransaction.objects.all(), request.GET)
+        spec = fast_serializers.TRANSACTION.select(fields, expand, extra=('transaction_date', 'id'))
+    except ValueError as e:
+        return _json({'error': str(e)}, status=400)
+
+    if request.GET.get('stream') in ('1', 'true'):
+        async def rows():
+            for queryset in (transactions, archived):
+                queryset = TransactionSerializer.optimize(queryset.order_by('-transaction_date', '-id'), fields, expand)
+                async for line in aiter_ndjson(queryset, TransactionSerializer, fields=fields, expand=expand):
+                    yield line
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+    try:
+        rows, next_cursor = await akeyset_page(transactions, request.GET.get('cursor'),
+                                               get_page_size(request.GET), archived, values=spec.lookups)
+    except InvalidCursor as e:
+        return _json({'error': str(e)}, status=400)
+    data = {'next_cursor': next_cursor, 'results': spec.many(rows)}
+    return HttpResponse(fast_serializers.render(data), content_type='application/json')
+
+
+@require_GET
+@read_from_replica
+async def get_card(request, pk):
+    """
+    Get a card by ID.
+    """
+    if await authenticate(request) is None:
+        return _unauthorized()
+    fields, expand = get_fieldset(request.GET)
+    try:
+        serializer = CardSerializer(fields=fields, expand=expand)
+    except ValueError as e:
+        return _json({'error': str(e)}, status=400)
+    try:
+        serializer.instance = await CardSerializer.optimize(ledger.with_balance(Card.objects.all()),
+                                                            fields, expand).aget(pk=pk)
+    except Card.DoesNotExist:
+        return _json({'error': 'Card not found'}, status=404)
+    return _json(serializer.data)
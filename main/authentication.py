@@ -0,0 +1,90 @@
+import copy
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .lru import LRUCache
+from .models import User
+
+
+_tokens = LRUCache(maxsize=getattr(settings, 'JWT_AUTH_CACHE_SIZE', 50000))
+_users = LRUCache(maxsize=getattr(settings, 'JWT_AUTH_CACHE_SIZE', 50000))
+
+
+def _ttl(validated_token):
+    return max(0.0, validated_token['exp'] - time.time())
+
+
+def claims_only():
+    return getattr(settings, 'JWT_AUTH_CLAIMS_ONLY', False)
+
+
+def user_from_claims(user_id):
+    """
+    Build an unsaved-looking User carrying only its id, for FK assignment and filters.
+    """
+    user = User(**{api_settings.USER_ID_FIELD: user_id}, is_active=True)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def cached_user(user_id):
+    user = _users.get(user_id)
+    return copy.copy(user) if user is not None else None
+
+
+def remember_user(user, validated_token):
+    _users.set(getattr(user, api_settings.USER_ID_FIELD), copy.copy(user), ttl=_ttl(validated_token))
+
+
+def forget_user(user_id):
+    _users.delete(user_id)
+
+
+def cached_token(raw_token):
+    return _tokens.get(raw_token)
+
+
+def remember_token(raw_token, validated_token):
+    _tokens.set(raw_token, validated_token, ttl=_ttl(validated_token))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that skips repeat work for tokens it has already seen.
+
+    Verified tokens are cached by their raw value and resolved users by id,
+    both in a bounded LRU and only until the token expires. With
+    JWT_AUTH_CLAIMS_ONLY the user is built from the token's claims and the
+    database is never queried.
+    """
+
+    def get_validated_token(self, raw_token):
+        key = raw_token.decode() if isinstance(raw_token, bytes) else raw_token
+        validated_token = cached_token(key)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            remember_token(key, validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        if claims_only():
+            return user_from_claims(user_id)
+
+        user = cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            remember_user(user, validated_token)
+            return user
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
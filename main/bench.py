@@ -0,0 +1,51 @@
+import statistics
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, **extra):
+    """
+    Turn per-request latencies (seconds) into a throughput/percentile report in ms.
+    """
+    latencies = sorted(latencies)
+    report = {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+    report.update(extra)
+    return report
+
+
+@contextmanager
+def test_database(keepdb=False):
+    """
+    Point the default connection, and any alias mirroring it such as the
+    read replica, at a throwaway test database for the duration.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    for alias in connections:
+        if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == 'default':
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
@@ -0,0 +1,206 @@
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .fast_serializers import MERCHANT, render
+from .lru import LRUCache
+from .models import Merchant, MerchantCategory
+
+
+MERCHANTS = 'merchants'
+CATEGORIES = 'categories'
+
+
+class CatalogCache:
+    """
+    Read-through cache for Merchant and MerchantCategory.
+
+    Every lookup checks a per-process LRU first, then the optional shared Django
+    cache named by CATALOG_CACHE_ALIAS, and only then the database. Entries are
+    dropped by the post_save/post_delete handlers in main.signals; the local TTL
+    bounds how long other processes can serve a stale row.
+    """
+
+    def __init__(self):
+        self.local = LRUCache(maxsize=getattr(settings, 'CATALOG_CACHE_SIZE', 4096),
+                              ttl=getattr(settings, 'CATALOG_CACHE_TTL', 60))
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'CATALOG_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def _key(self, table, pk=None):
+        return f'catalog:{table}:{"all" if pk is None else pk}'
+
+    @staticmethod
+    def _pk(pk, model):
+        """
+        pk as an int, so '7' and 7 share a cache entry; anything else does not exist.
+        """
+        try:
+            return int(pk)
+        except (TypeError, ValueError):
+            raise model.DoesNotExist from None
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _get(self, key, load):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        if value is not None:
+            self._count(True)
+            return value
+
+        self._count(False)
+        value = load()
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, timeout=getattr(settings, 'CATALOG_SHARED_CACHE_TTL', 3600))
+        return value
+
+    def get_merchant(self, pk):
+        """
+        Return the Merchant with its category loaded, or raise Merchant.DoesNotExist.
+        """
+        pk = self._pk(pk, Merchant)
+        merchant = self._get(self._key(MERCHANTS, pk),
+                             lambda: Merchant.objects.select_related('category').filter(pk=pk).first() or False)
+        if merchant is False:
+            raise Merchant.DoesNotExist
+        return merchant
+
+    def list_merchants(self):
+        """
+        Return every merchant as the dicts MerchantSerializer would produce.
+        """
+        return self._get(self._key(MERCHANTS),
+                         lambda: MERCHANT.many(MERCHANT.rows(Merchant.objects.order_by('id'))))
+
+    def get_category(self, pk):
+        """
+        Return the MerchantCategory, or raise MerchantCategory.DoesNotExist.
+        """
+        pk = self._pk(pk, MerchantCategory)
+        category = self._get(self._key(CATEGORIES, pk),
+                             lambda: MerchantCategory.objects.filter(pk=pk).first() or False)
+        if category is False:
+            raise MerchantCategory.DoesNotExist
+        return category
+
+    def list_categories(self):
+        return self._get(self._key(CATEGORIES), lambda: list(MerchantCategory.objects.order_by('id')))
+
+    def invalidate(self, table, pks=()):
+        """
+        Drop the list entry for table and the per-row entries for pks, and bump the table version.
+        """
+        keys = [self._key(table)] + [self._key(table, pk) for pk in pks]
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete_many(keys)
+        self.bump(table)
+
+    def version(self, table):
+        """
+        Return (token, modified_at) for table.
+
+        Without a shared cache other processes never see our bumps, so the
+        per-process token is rotated every CATALOG_CACHE_TTL seconds and
+        modified_at is None, since this clock cannot vouch for their writes.
+        """
+        shared = self.shared
+        if shared is not None:
+            key = f'catalog:version:{table}'
+            version = shared.get(key)
+            if version is None:
+                shared.add(key, (uuid.uuid4().hex, int(time.time())), timeout=None)
+                version = shared.get(key)
+            return version
+        with self._lock:
+            token = self._versions.get(table)
+            if token is None or token[1] <= time.monotonic():
+                ttl = self.local.ttl
+                token = self._versions[table] = (uuid.uuid4().hex,
+                                                 time.monotonic() + ttl if ttl is not None else math.inf)
+        return token[0], None
+
+    def bump(self, table):
+        if self.shared is not None:
+            self.shared.set(f'catalog:version:{table}', (uuid.uuid4().hex, int(time.time())), timeout=None)
+        with self._lock:
+            self._versions.pop(table, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'local_size': len(self.local)}
+
+
+catalog = CatalogCache()
+
+
+def catalog_response(*tables):
+    """
+    Add ETag/Last-Modified handling and a rendered-response cache to a catalogue view.
+
+    The ETag is built from the versions of tables, so matching If-None-Match
+    requests get a 304 without touching the view, and JSON bodies are cached
+    per URL and version so repeat requests skip the ORM and serialization.
+    Put it under @api_view so authentication still runs first.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            versions = [catalog.version(table) for table in tables]
+            etag = quote_etag('-'.join(token for token, _ in versions))
+            stamps = [modified for _, modified in versions]
+            last_modified = max(stamps) if None not in stamps else None
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                if not_modified.status_code == 304:
+                    not_modified['ETag'] = etag
+                return not_modified
+
+            cacheable = request.method == 'GET' and request.accepted_renderer.format == 'json'
+            key = f'catalog:response:{etag}:{request.get_full_path()}'
+            content = catalog.local.get(key) if cacheable else None
+            if content is None and cacheable and catalog.shared is not None:
+                content = catalog.shared.get(key)
+            if content is None:
+                response = view(request, *args, **kwargs)
+                if not cacheable or response.status_code != 200:
+                    return response
+                # Views may return a DRF Response or bytes already rendered by _fast_response.
+                content = render(response.data) if hasattr(response, 'data') else response.content
+                catalog.local.set(key, content)
+                if catalog.shared is not None:
+                    catalog.shared.set(key, content, timeout=getattr(settings, 'CATALOG_SHARED_CACHE_TTL', 3600))
+
+            response = HttpResponse(content, content_type='application/json')
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,153 @@
+import csv
+import io
+import zlib
+
+from .models import ArchivedTransaction, Transaction
+from .pagination import filter_transactions
+
+
+COLUMNS = [
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('merchant_id', 'merchant_id'),
+    ('merchant_name', 'merchant__name'),
+    ('category_id', 'merchant__category_id'),
+    ('category_name', 'merchant__category__name'),
+    ('amount', 'amount'),
+    ('phone_number', 'phone_number'),
+    ('transaction_date', 'transaction_date'),
+    ('device_id', 'device_id'),
+    ('ip_address', 'ip_address'),
+]
+
+CONTENT_TYPES = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'csv': ('application/gzip', 'csv.gz'),
+}
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_format():
+    return 'parquet' if pyarrow_available() else 'csv'
+
+
+def iter_chunks(params, chunk_size=50000):
+    """
+    Yield lists of row tuples (in COLUMNS order) for live then archived transactions.
+
+    Rows are read through .iterator(), which uses a server-side cursor on
+    PostgreSQL, so memory is bounded by chunk_size whatever the export size.
+    """
+    lookups = [lookup for _, lookup in COLUMNS]
+    for model in (Transaction, ArchivedTransaction):
+        queryset = filter_transactions(model.objects.all(), params).order_by('id').values_list(*lookups)
+        chunk = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class _Sink(io.RawIOBase):
+    """
+    Write-only file object whose contents are drained by the streaming generator.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('merchant_id', pa.int64()),
+        ('merchant_name', pa.string()),
+        ('category_id', pa.int64()),
+        ('category_name', pa.string()),
+        ('amount', pa.decimal128(10, 2)),
+        ('phone_number', pa.string()),
+        ('transaction_date', pa.timestamp('us', tz='UTC')),
+        ('device_id', pa.string()),
+        ('ip_address', pa.string()),
+    ])
+
+
+def _arrow_batch(schema, chunk):
+    import pyarrow as pa
+
+    columns = list(zip(*chunk))
+    return pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def stream(params, output, chunk_size=50000):
+    """
+    Yield the export as bytes in the given output format: parquet, arrow or csv (gzip).
+    """
+    if output == 'csv':
+        yield from _stream_csv(params, chunk_size)
+        return
+
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    schema = _arrow_schema()
+    sink = _Sink()
+    if output == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    for chunk in iter_chunks(params, chunk_size):
+        batch = _arrow_batch(schema, chunk)
+        if output == 'parquet':
+            writer.write_batch(batch, row_group_size=chunk_size)
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _stream_csv(params, chunk_size):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS])
+    for chunk in iter_chunks(params, chunk_size):
+        writer.writerows(
+            row[:8] + (row[8].isoformat(),) + row[9:] for row in chunk
+        )
+        yield compressor.compress(buffer.getvalue().encode())
+        buffer.seek(0)
+        buffer.truncate()
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
@@ -0,0 +1,170 @@
+import json
+from decimal import Decimal
+
+from django.utils import timezone
+from rest_framework.settings import api_settings
+
+
+# Read-only serializers that turn .values_list() tuples straight into the
+# dicts (and JSON bytes) the DRF serializers in serializers.py produce, without
+# building model instances or running per-field machinery. Each spec is
+# compiled once into a single function; output must stay byte-for-byte equal
+# to ModelSerializer + JSONRenderer, which bench_serializers checks.
+
+
+def decimal_field(places):
+    quantum = Decimal(1).scaleb(-places)
+
+    def convert(value):
+        return None if value is None else '{:f}'.format(value.quantize(quantum))
+    return convert
+
+
+def datetime_field(value):
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = value.astimezone(timezone.get_current_timezone())
+    text = value.isoformat()
+    if text.endswith('+00:00'):
+        text = text[:-6] + 'Z'
+    return text
+
+
+def related(prefix, fields):
+    """
+    Re-root a field spec under a relation, e.g. MERCHANT_FIELDS read through a transaction's merchant.
+    """
+    return [(field[0], related(prefix, field[1])) if isinstance(field[1], list)
+            else (field[0], f'{prefix}__{field[1]}', *field[2:]) for field in fields]
+
+
+class FastSerializer:
+    """
+    fields is a list of (name, lookup) or (name, lookup, converter) tuples, or
+    (name, [fields]) for a nested object built from the same row.
+
+    expand maps a field name to the nested spec that replaces it on request,
+    and extra lookups are read after the output fields without being returned.
+    """
+
+    def __init__(self, fields, expand=None, extra=()):
+        self.fields = fields
+        self.expand = expand or {}
+        self.names = [field[0] for field in fields]
+        self.lookups = []
+        self._variants = {}
+        namespace = {}
+        body = self._compile(fields, namespace)
+        exec(f'def to_dict(row):\n    return {body}', namespace)
+        self.to_dict = namespace['to_dict']
+        self.lookups.extend([lookup for lookup in extra if lookup not in self.lookups])
+
+    def select(self, fields=None, expand=(), extra=()):
+        """
+        Return a serializer for a sparse fieldset: only fields (all when None)
+        and the relations in expand, nested in full, in spec order. Compiled
+        once per combination.
+        Raises ValueError for names this spec does not have.
+        """
+        key = (tuple(sorted(set(fields))) if fields is not None else None, tuple(sorted(set(expand))), tuple(extra))
+        variant = self._variants.get(key)
+        if variant is None:
+            for name in expand:
+                if name not in self.expand:
+                    raise ValueError(f'Cannot expand {name}.')
+            unknown = [name for name in fields or () if name not in self.names]
+            if unknown:
+                raise ValueError(f'Unknown field(s): {", ".join(unknown)}.')
+            spec = [(field[0], self.expand[field[0]]) if field[0] in expand else field
+                    for field in self.fields if fields is None or field[0] in fields or field[0] in expand]
+            variant = self._variants[key] = FastSerializer(spec, extra=extra)
+        return variant
+
+    def _compile(self, fields, namespace):
+        items = []
+        for field in fields:
+            name = field[0]
+            if isinstance(field[1], list):
+                items.append(f'{name!r}: {self._compile(field[1], namespace)}')
+                continue
+            index = len(self.lookups)
+            self.lookups.append(field[1])
+            if len(field) > 2:
+                converter = f'_convert_{index}'
+                namespace[converter] = field[2]
+                items.append(f'{name!r}: {converter}(row[{index}])')
+            else:
+                items.append(f'{name!r}: row[{index}]')
+        return '{' + ', '.join(items) + '}'
+
+    def rows(self, queryset):
+        return queryset.values_list(*self.lookups)
+
+    def many(self, rows):
+        to_dict = self.to_dict
+        return [to_dict(row) for row in rows]
+
+
+# An expanded user carries its id next to what UserSerializer returns.
+USER_FIELDS = [
+    ('id', 'id'),
+    ('username', 'username'),
+    ('phone_number', 'phone_number'),
+]
+
+MERCHANT_FIELDS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('phone_number', 'phone_number'),
+    ('category', [
+        ('id', 'category_id'),
+        ('name', 'category__name'),
+        ('description', 'category__description'),
+    ]),
+]
+
+TRANSACTION = FastSerializer([
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('merchant', 'merchant_id'),
+    ('amount', 'amount', decimal_field(2)),
+    ('phone_number', 'phone_number'),
+    ('transaction_date', 'transaction_date', datetime_field),
+    ('device_id', 'device_id'),
+    ('ip_address', 'ip_address'),
+], expand={'user': related('user', USER_FIELDS), 'merchant': related('merchant', MERCHANT_FIELDS)})
+
+CARD = FastSerializer([
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('card_number', 'card_number'),
+    ('card_type', 'card_type'),
+    ('bank_name', 'bank_name'),
+    ('balance', 'current_balance', decimal_field(2)),
+], expand={'user': related('user', USER_FIELDS)})
+
+MERCHANT = FastSerializer(MERCHANT_FIELDS)
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def render(data):
+    """
+    Encode data the way rest_framework.renderers.JSONRenderer does, using orjson when installed.
+    """
+    if orjson is not None and api_settings.COMPACT_JSON and api_settings.UNICODE_JSON:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(
+            data,
+            ensure_ascii=not api_settings.UNICODE_JSON,
+            allow_nan=not api_settings.STRICT_JSON,
+            separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': '),
+        ).encode()
+    # JSONRenderer escapes these for JavaScript compatibility.
+    return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import re
+
+from django.conf import settings
+from django.db import models
+
+
+BIN_LENGTH = 6
+
+
+def digits_only(value):
+    # JSON clients may send numbers; CharField used to coerce them to str.
+    return re.sub(r'\D', '', str(value)) if value is not None else value
+
+
+def pan_hash(card_number):
+    """
+    Keyed SHA-256 of the digits of a card number, safe to index and compare.
+    """
+    return hmac.new(settings.CARD_HASH_KEY.encode(), digits_only(card_number).encode(), hashlib.sha256).hexdigest()
+
+
+def bin_prefix(card_number):
+    return digits_only(card_number)[:BIN_LENGTH]
+
+
+class DigitsField(models.CharField):
+    """
+    CharField stored and queried as digits only, so '8600 1234-...' and
+    '86001234...' are the same value in filters and on disk.
+    """
+
+    def pre_save(self, model_instance, add):
+        value = digits_only(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def get_prep_value(self, value):
+        return digits_only(super().get_prep_value(value))
+
+
+class DerivedCharField(models.CharField):
+    """
+    CharField recomputed from another field of the same model on every save,
+    including bulk_create.
+    """
+
+    derive = None
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        kwargs.pop('editable', None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        source = getattr(model_instance, self.source)
+        value = self.derive(source) if source else ''
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class PanHashField(DerivedCharField):
+    derive = staticmethod(pan_hash)
+
+
+class BinPrefixField(DerivedCharField):
+    derive = staticmethod(bin_prefix)
@@ -0,0 +1,238 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+DEFAULT_RULES = {
+    'user_per_minute': 10,
+    'card_per_minute': 10,
+    'ip_per_minute': 30,
+    'devices_per_user_hour': 3,
+    'users_per_device_hour': 3,
+    'ips_per_user_hour': 5,
+    'amount_spike_ratio': 5,
+    'amount_spike_min_history': 5,
+    'block_score': 100,
+}
+
+# How much each tripped rule adds to the score.
+WEIGHTS = {
+    'user_velocity': 60,
+    'card_velocity': 60,
+    'ip_velocity': 40,
+    'device_churn': 50,
+    'shared_device': 50,
+    'ip_churn': 40,
+    'amount_spike': 50,
+}
+
+
+class MemoryBackend:
+    """
+    Per-process sliding-window counters. Every operation is amortized O(1).
+
+    Keys idle the longest are dropped once more than max_keys are tracked.
+    """
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or getattr(settings, 'FRAUD_MAX_KEYS', 200000)
+        self._events = OrderedDict()
+        self._members = OrderedDict()
+        self._averages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, table, key, factory):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = factory()
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return entry
+
+    def hit(self, key, window, now):
+        """
+        Record one event for key and return how many fell inside the last window seconds.
+        """
+        with self._lock:
+            events = self._entry(self._events, key, deque)
+            events.append(now)
+            while events[0] <= now - window:
+                events.popleft()
+            return len(events)
+
+    def distinct(self, key, member, window, now):
+        """
+        Record member under key and return how many distinct members were seen in the window.
+        """
+        with self._lock:
+            members = self._entry(self._members, key, OrderedDict)
+            members[member] = now
+            members.move_to_end(member)
+            while next(iter(members.values())) <= now - window:
+                members.popitem(last=False)
+            return len(members)
+
+    def average(self, key):
+        return self._averages.get(key, (0.0, 0))
+
+    def observe(self, key, value, alpha):
+        with self._lock:
+            mean, count = self._entry(self._averages, key, lambda: (0.0, 0))
+            mean = value if count == 0 else mean + alpha * (value - mean)
+            self._averages[key] = (mean, count + 1)
+
+
+class CacheBackend:
+    """
+    Shared counters in the Django cache named by FRAUD_CACHE_ALIAS, for multi-process deployments.
+
+    Windows are split into BUCKETS fixed slots, so a lookup reads a constant
+    number of keys. Distinct counts are approximate under concurrent writers.
+    """
+
+    BUCKETS = 6
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'FRAUD_CACHE_ALIAS', 'default')]
+
+    def _slots(self, key, window, now):
+        size = window / self.BUCKETS
+        current = math.floor(now / size)
+        return [f'fraud:{key}:{window}:{slot}' for slot in range(current - self.BUCKETS + 1, current + 1)], window + size
+
+    def hit(self, key, window, now):
+        slots, ttl = self._slots(key, window, now)
+        self.cache.add(slots[-1], 0, timeout=ttl)
+        self.cache.incr(slots[-1])
+        return sum(self.cache.get_many(slots).values())
+
+    def distinct(self, key, member, window, now):
+        slots, ttl = self._slots(key, window, now)
+        current = self.cache.get(slots[-1]) or set()
+        if member not in current:
+            current.add(member)
+            self.cache.set(slots[-1], current, timeout=ttl)
+        return len(set().union(*self.cache.get_many(slots).values()))
+
+    def average(self, key):
+        return self.cache.get(f'fraud:avg:{key}', (0.0, 0))
+
+    def observe(self, key, value, alpha):
+        mean, count = self.average(key)
+        mean = value if count == 0 else mean + alpha * (value - mean)
+        self.cache.set(f'fraud:avg:{key}', (mean, count + 1), timeout=None)
+
+
+class Assessment:
+    def __init__(self, score, reasons, blocked):
+        self.score = score
+        self.reasons = reasons
+        self.blocked = blocked
+
+
+class VelocityEngine:
+    """
+    Scores a payment from sliding-window counters keyed by user, card, device and IP.
+    """
+
+    def __init__(self, backend, rules=None):
+        self.backend = backend
+        self.rules = {**DEFAULT_RULES, **(rules or {})}
+
+    def assess(self, user_id, card_id, device_id, ip_address, amount, now=None):
+        """
+        Record the attempt and return an Assessment. Call once per payment, before the debit.
+        """
+        now = time.time() if now is None else now
+        reasons = self._velocity(user_id, card_id, ip_address, now)
+        return self._assessment(user_id, amount, reasons + self._profile(user_id, device_id, ip_address, amount, now))
+
+    def batch(self, user_id, ip_address, now=None):
+        """
+        Return a BatchAssessment for the items of one bulk request.
+        """
+        return BatchAssessment(self, user_id, ip_address, time.time() if now is None else now)
+
+    def _velocity(self, user_id, card_id, ip_address, now):
+        rules = self.rules
+        backend = self.backend
+        reasons = []
+        if user_id is not None and backend.hit(f'user:{user_id}', 60, now) > rules['user_per_minute']:
+            reasons.append('user_velocity')
+        if card_id is not None and backend.hit(f'card:{card_id}', 60, now) > rules['card_per_minute']:
+            reasons.append('card_velocity')
+        if ip_address and backend.hit(f'ip:{ip_address}', 60, now) > rules['ip_per_minute']:
+            reasons.append('ip_velocity')
+        return reasons
+
+    def _profile(self, user_id, device_id, ip_address, amount, now):
+        rules = self.rules
+        backend = self.backend
+        reasons = []
+        if device_id:
+            if backend.distinct(f'user-devices:{user_id}', device_id, 3600, now) > rules['devices_per_user_hour']:
+                reasons.append('device_churn')
+            if backend.distinct(f'device-users:{device_id}', user_id, 3600, now) > rules['users_per_device_hour']:
+                reasons.append('shared_device')
+        if ip_address and backend.distinct(f'user-ips:{user_id}', ip_address, 3600, now) > rules['ips_per_user_hour']:
+            reasons.append('ip_churn')
+
+        mean, count = backend.average(f'amount:{user_id}')
+        if count >= rules['amount_spike_min_history'] and mean and float(amount) > mean * rules['amount_spike_ratio']:
+            reasons.append('amount_spike')
+        return reasons
+
+    def _assessment(self, user_id, amount, reasons):
+        score = sum(WEIGHTS[reason] for reason in reasons)
+        blocked = score >= self.rules['block_score']
+        if not blocked:
+            self.backend.observe(f'amount:{user_id}', float(amount), alpha=0.2)
+        return Assessment(score, reasons, blocked)
+
+
+class BatchAssessment:
+    """
+    Scores the items of one bulk request.
+
+    The request counts as one velocity event for its user and IP, and for
+    each card on that card's first item, so a batch is not declined for its
+    own size. Device, IP churn and amount checks still run per item.
+    """
+
+    def __init__(self, engine, user_id, ip_address, now):
+        self.engine = engine
+        self.user_id = user_id
+        self.ip_address = ip_address
+        self.now = now
+        self.velocity = engine._velocity(user_id, None, ip_address, now)
+        self.cards = {}
+
+    def assess(self, card_id, device_id, amount):
+        if card_id not in self.cards:
+            self.cards[card_id] = self.engine._velocity(None, card_id, None, self.now)
+        reasons = self.velocity + self.cards[card_id]
+        reasons = reasons + self.engine._profile(self.user_id, device_id, self.ip_address, amount, self.now)
+        return self.engine._assessment(self.user_id, amount, reasons)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Return the process-wide engine built from FRAUD_BACKEND and FRAUD_RULES.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            backend = import_string(getattr(settings, 'FRAUD_BACKEND', 'main.fraud.MemoryBackend'))()
+            _engine = VelocityEngine(backend, getattr(settings, 'FRAUD_RULES', None))
+        return _engine
@@ -0,0 +1,128 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .lru import LRUCache
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def get_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+# (user_id, key) -> (created_at, fingerprint, status, body). Entries are
+# checked against created_at, so a key replays for the same TTL whether it
+# is served from here or from the table.
+_cache = LRUCache(maxsize=getattr(settings, 'IDEMPOTENCY_CACHE_SIZE', 10000),
+                  ttl=get_ttl().total_seconds())
+
+
+class KeyReused(Exception):
+    pass
+
+
+def fingerprint(data):
+    """
+    Hash a parsed request body; key order and whitespace do not matter.
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def lookup(user_id, key):
+    """
+    Return the stored (created_at, fingerprint, status, body) for a key, or None if unseen or expired.
+    """
+    cached = _cache.get((user_id, key))
+    if cached is not None:
+        if cached[0] >= timezone.now() - get_ttl():
+            return cached
+        _cache.delete((user_id, key))
+
+    record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.created_at < timezone.now() - get_ttl():
+        record.delete()
+        return None
+    stored = (record.created_at, record.request_fingerprint, record.response_status, record.response_body)
+    _cache.set((user_id, key), stored)
+    return stored
+
+
+def _replay(stored, request_fingerprint):
+    created_at, stored_fingerprint, status_code, body = stored
+    # Keys stored before fingerprints were recorded have none to compare.
+    if stored_fingerprint and request_fingerprint and stored_fingerprint != request_fingerprint:
+        raise KeyReused(f'{HEADER} was already used for a different request.')
+    return status_code, body
+
+
+def execute(user_id, key, handler, request_fingerprint=''):
+    """
+    Run handler() at most once per (user_id, key) and return its (status, body).
+
+    The key row is inserted in the same database transaction as the handler's
+    writes, so two racing retries cannot both commit: the loser hits the unique
+    constraint, rolls back its debit and replays the winner's response.
+    Server errors are not stored so they can be retried. Raises KeyReused
+    when the key was stored with a different request_fingerprint.
+    """
+    stored = lookup(user_id, key)
+    if stored is not None:
+        return _replay(stored, request_fingerprint)
+
+    try:
+        with db_transaction.atomic():
+            status_code, body = handler()
+            if status_code >= 500:
+                return status_code, body
+            record = IdempotencyKey.objects.create(user_id=user_id, key=key, request_fingerprint=request_fingerprint,
+                                                   response_status=status_code, response_body=body)
+    except IntegrityError:
+        stored = lookup(user_id, key)
+        if stored is None:
+            raise
+        return _replay(stored, request_fingerprint)
+
+    _cache.set((user_id, key), (record.created_at, request_fingerprint, status_code, body))
+    return status_code, body
+
+
+def run_once(request, handler):
+    """
+    Run handler(request) at most once per Idempotency-Key header and user.
+    A key reused with a different body is answered 422.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler(request)
+    if len(key) > MAX_KEY_LENGTH:
+        return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'}, status=400)
+
+    def call():
+        response = handler(request)
+        return response.status_code, response.data
+
+    try:
+        status_code, body = execute(request.user.pk, key, call, fingerprint(request.data))
+    except KeyReused as e:
+        return Response({'error': str(e)}, status=422)
+    return Response(body, status=status_code)
+
+
+def purge_expired():
+    """
+    Delete stored keys older than IDEMPOTENCY_KEY_TTL. Returns the number removed.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - get_ttl()).delete()
+    return deleted
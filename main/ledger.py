@@ -0,0 +1,177 @@
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import BalanceSnapshot, Card, LedgerEntry
+
+
+# Append-only double-entry ledger. Each posting is a set of LedgerEntry rows
+# sharing a posting id whose amounts sum to zero. A card's balance is its
+# last snapshot (kept in Card.balance) plus the entries compact() has not
+# folded in yet, so existing cards start from their current balance with no
+# backfill, and credits are plain INSERTs that never touch the card row.
+
+EXTERNAL = {}
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def card(card_id):
+    return {'card_id': card_id}
+
+
+def merchant(merchant_id):
+    return {'merchant_id': merchant_id} if merchant_id else EXTERNAL
+
+
+def legs(kind, amount, source, target, transaction_id=None):
+    """
+    Return the two unsaved entries that move amount from source to target.
+    """
+    posting = uuid.uuid4()
+    return [
+        LedgerEntry(posting=posting, kind=kind, amount=-amount, transaction_id=transaction_id, **source),
+        LedgerEntry(posting=posting, kind=kind, amount=amount, transaction_id=transaction_id, **target),
+    ]
+
+
+def post(entries):
+    return LedgerEntry.objects.bulk_create(entries)
+
+
+def _pending():
+    entries = (LedgerEntry.objects.filter(card=OuterRef('pk'), snapshot__isnull=True)
+               .order_by().values('card').annotate(total=Sum('amount')).values('total'))
+    return Coalesce(Subquery(entries), Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def with_balance(queryset):
+    """
+    Annotate Card rows with current_balance, read in the same statement as the snapshot so it is consistent.
+    """
+    return queryset.annotate(current_balance=F('balance') + _pending())
+
+
+def balances(card_ids):
+    return dict(with_balance(Card.objects.filter(pk__in=card_ids)).values_list('pk', 'current_balance'))
+
+
+def balance(card_id):
+    """
+    Return the card's current balance, or None if it does not exist.
+    """
+    return balances([card_id]).get(card_id)
+
+
+def lock(card_ids):
+    """
+    Serialize debits against these cards until the surrounding transaction ends.
+
+    PostgreSQL uses transaction-level advisory locks keyed by card id, so the
+    card row itself is never locked or rewritten and credits are not held up.
+    """
+    card_ids = sorted(set(card_ids))
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for card_id in card_ids:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [card_id])
+    else:
+        list(Card.objects.select_for_update().filter(pk__in=card_ids).values_list('pk', flat=True))
+
+
+def debit(card_id, amount, merchant_id=None, transaction_id=None, kind=LedgerEntry.PAYMENT):
+    """
+    Move amount from a card to a merchant (or out of the system). Call inside atomic.
+
+    Raises InsufficientFunds when the card cannot cover it.
+    """
+    lock([card_id])
+    current = balance(card_id)
+    if current is None or current < amount:
+        raise InsufficientFunds('Insufficient funds.')
+    post(legs(kind, amount, card(card_id), merchant(merchant_id), transaction_id))
+
+
+def credit(card_id, amount, merchant_id=None, transaction_id=None, kind=LedgerEntry.DEPOSIT):
+    """
+    Move amount to a card from a merchant (or from outside the system). Takes no lock.
+    """
+    post(legs(kind, amount, merchant(merchant_id), card(card_id), transaction_id))
+
+
+def adjust(card_id, target):
+    """
+    Post an adjustment that brings the card's balance to target.
+    """
+    with db_transaction.atomic():
+        lock([card_id])
+        difference = target - balance(card_id)
+        if difference:
+            post(legs(LedgerEntry.ADJUSTMENT, difference, EXTERNAL, card(card_id)))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def compact(card_ids=None, batch_size=500):
+    """
+    Fold pending entries into a new BalanceSnapshot and Card.balance per card.
+
+    Cards are handled batch_size at a time, each batch in one transaction
+    with one query per step, so hot cards stay cheap to read. Entries that
+    commit while a batch runs are simply left for the next pass. Returns the
+    number of cards compacted.
+    """
+    pending = LedgerEntry.objects.filter(snapshot__isnull=True, card__isnull=False)
+    if card_ids is not None:
+        pending = pending.filter(card_id__in=card_ids)
+    cards_with_pending = sorted(set(pending.values_list('card_id', flat=True)))
+
+    compacted = 0
+    for chunk in _chunks(cards_with_pending, batch_size):
+        with db_transaction.atomic():
+            bases = dict(Card.objects.select_for_update().filter(pk__in=chunk).order_by('pk')
+                         .values_list('pk', 'balance'))
+            totals = defaultdict(Decimal)
+            entry_ids = defaultdict(list)
+            for entry_id, card_id, amount in (LedgerEntry.objects.filter(card_id__in=chunk, snapshot__isnull=True)
+                                              .values_list('id', 'card_id', 'amount')):
+                totals[card_id] += amount
+                entry_ids[card_id].append(entry_id)
+
+            snapshots = BalanceSnapshot.objects.bulk_create([
+                BalanceSnapshot(card_id=card_id, balance=bases[card_id] + totals[card_id],
+                                last_entry_id=max(entry_ids[card_id]))
+                for card_id in entry_ids if card_id in bases
+            ])
+            if not snapshots:
+                continue
+            LedgerEntry.objects.filter(pk__in=[entry_id for snapshot in snapshots
+                                               for entry_id in entry_ids[snapshot.card_id]]).update(
+                snapshot=Case(*[When(card_id=snapshot.card_id, then=Value(snapshot.pk)) for snapshot in snapshots])
+            )
+            Card.objects.filter(pk__in=[snapshot.card_id for snapshot in snapshots]).update(
+                balance=Case(*[When(pk=snapshot.card_id, then=Value(snapshot.balance)) for snapshot in snapshots],
+                             output_field=DecimalField(max_digits=10, decimal_places=2))
+            )
+            compacted += len(snapshots)
+    return compacted
+
+
+def unbalanced_postings():
+    """
+    Return the posting ids whose entries do not sum to zero. Should always be empty.
+    """
+    return list(LedgerEntry.objects.order_by().values('posting').annotate(total=Sum('amount'))
+                .exclude(total=0).values_list('posting', flat=True))
@@ -0,0 +1,33 @@
+from .fields import BIN_LENGTH, digits_only, pan_hash
+from .models import Card, Transaction, User
+
+
+def cards_by_number(card_number):
+    """
+    Cards with exactly this number, found through the indexed hash column.
+    """
+    return Card.objects.filter(card_number_hash=pan_hash(card_number))
+
+
+def cards_by_prefix(prefix):
+    """
+    Cards whose number starts with prefix, for BIN routing.
+
+    Accepts masked PANs such as '8600 12** **** 1234': only the leading digits
+    before the first mask character are used. A full BIN is an equality match
+    on bin_prefix; shorter prefixes become an indexed LIKE 'x%' scan.
+    """
+    leading = digits_only(prefix.split('*', 1)[0])
+    if not leading:
+        return Card.objects.none()
+    if len(leading) >= BIN_LENGTH:
+        return Card.objects.filter(bin_prefix=leading[:BIN_LENGTH], card_number__startswith=leading)
+    return Card.objects.filter(bin_prefix__startswith=leading)
+
+
+def users_by_phone(phone_number):
+    return User.objects.filter(phone_number=digits_only(phone_number))
+
+
+def transactions_by_phone(phone_number):
+    return Transaction.objects.filter(phone_number=digits_only(phone_number))
@@ -0,0 +1,67 @@
+import gzip
+import os
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.utils.encoders import JSONEncoder
+
+from main import partitions
+from main.models import ArchivedTransaction, Transaction
+
+
+FIELDS = ['id', 'user_id', 'merchant_id', 'amount', 'phone_number', 'transaction_date', 'device_id', 'ip_address']
+
+
+class Command(BaseCommand):
+    help = ('Move transactions older than a cutoff into the archive table in chunks. '
+            'Archived rows stay readable through the transaction endpoints.')
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--before', help='Archive rows dated before this day (YYYY-MM-DD).')
+        group.add_argument('--keep-days', type=int, help='Archive rows older than this many days.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dump-dir', help='Also append moved rows to a gzip NDJSON file per month here.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            cutoff = parse_date(options['before'])
+            if cutoff is None:
+                raise CommandError('--before must be YYYY-MM-DD.')
+        else:
+            cutoff = timezone.localdate() - timedelta(days=options['keep_days'])
+
+        rows = (Transaction.objects.filter(transaction_date__lt=timezone.make_aware(datetime.combine(cutoff, time.min)))
+                .order_by('id').values(*FIELDS))
+        encoder = JSONEncoder()
+        moved = 0
+        while True:
+            chunk = list(rows[:options['chunk_size']])
+            if not chunk:
+                break
+            with db_transaction.atomic():
+                ArchivedTransaction.objects.bulk_create([ArchivedTransaction(**row) for row in chunk],
+                                                        ignore_conflicts=True)
+                # Nothing references or listens on Transaction, so this is a single DELETE.
+                Transaction.objects.filter(id__in=[row['id'] for row in chunk]).delete()
+            if options['dump_dir']:
+                self.dump(options['dump_dir'], chunk, encoder)
+            moved += len(chunk)
+            self.stdout.write(f'{moved} transactions archived')
+
+        if partitions.is_partitioned():
+            for name in partitions.drop_empty_before(cutoff):
+                self.stdout.write(f'Dropped empty partition {name}')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} transactions dated before {cutoff}.'))
+
+    def dump(self, directory, chunk, encoder):
+        os.makedirs(directory, exist_ok=True)
+        by_month = {}
+        for row in chunk:
+            by_month.setdefault(f'{row["transaction_date"]:%Y-%m}', []).append(row)
+        for month, rows in by_month.items():
+            with gzip.open(os.path.join(directory, f'transactions-{month}.ndjson.gz'), 'at') as f:
+                f.writelines(encoder.encode(row) + '\n' for row in rows)
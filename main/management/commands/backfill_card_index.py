@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from main.fields import bin_prefix, digits_only, pan_hash
+from main.models import Card, Transaction, User
+
+
+class Command(BaseCommand):
+    help = ('Normalize card and phone numbers to digits and fill card_number_hash/bin_prefix '
+            'for rows written before those columns existed, in id-ordered chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.backfill(Card, ['card_number', 'card_number_hash', 'bin_prefix'], self.normalize_card, options['chunk_size'])
+        self.backfill(User, ['phone_number'], self.normalize_phone, options['chunk_size'])
+        self.backfill(Transaction, ['phone_number'], self.normalize_phone, options['chunk_size'])
+
+    def normalize_card(self, card):
+        card.card_number = digits_only(card.card_number)
+        card.card_number_hash = pan_hash(card.card_number)
+        card.bin_prefix = bin_prefix(card.card_number)
+
+    def normalize_phone(self, obj):
+        obj.phone_number = digits_only(obj.phone_number)
+
+    def backfill(self, model, fields, normalize, chunk_size):
+        queryset = model.objects.order_by('id').only('id', *fields)
+        last_id = 0
+        processed = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            for obj in chunk:
+                normalize(obj)
+            with db_transaction.atomic():
+                model.objects.bulk_update(chunk, fields)
+            last_id = chunk[-1].id
+            processed += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'{model.__name__}: {processed} rows backfilled.'))
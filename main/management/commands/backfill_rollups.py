@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from main import rollups
+from main.models import ArchivedTransaction, Refund, SpendDelta, Transaction
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the daily spend rollups from scratch: live and archived transactions, '
+            'net of refunds, streamed in chunks. Run while writes are paused.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        with db_transaction.atomic():
+            for model, _ in rollups.DIMENSIONS:
+                model.objects.all().delete()
+            SpendDelta.objects.all().delete()
+
+        processed = 0
+        for model, sign in ((ArchivedTransaction, 1), (Transaction, 1), (Refund, -1)):
+            rows = (model.objects.order_by('id')
+                    .values_list('id', 'user_id', 'merchant_id', 'merchant__category_id', 'transaction_date', 'amount'))
+            last_id = 0
+            while True:
+                chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+                if not chunk:
+                    break
+                with db_transaction.atomic():
+                    rollups.apply((rollups.to_row(user_id, merchant_id, category_id, date, amount)
+                                   for _, user_id, merchant_id, category_id, date, amount in chunk), sign=sign)
+                last_id = chunk[-1][0]
+                processed += len(chunk)
+                self.stdout.write(f'{processed} rows rolled up')
+
+        while rollups.fold(chunk_size):
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Done: {processed} transactions and refunds.'))
@@ -0,0 +1,238 @@
+import itertools
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from main import urls as main_urls
+from main.bench import summarize, test_database
+from main.models import Card, Merchant, MerchantCategory, Transaction, User
+from main.seed import seed
+
+
+class Route:
+    def __init__(self, method, kwargs=None, body=None, query=None):
+        self.method = method
+        self.kwargs = kwargs or (lambda ctx, i: {})
+        self.body = body
+        self.query = query
+
+
+def _payment(ctx, i):
+    return {'merchant_id': ctx['merchant'], 'amount': '1.00', 'phone_number': '+998900000000', 'device_id': f'bench-{i}'}
+
+
+# How to call each named route in main/urls.py. i is the request number, so
+# routes that consume objects (deletes, creates with unique fields) never collide.
+ROUTES = {
+    'list_users': Route('get'),
+    'create_user': Route('post', body=lambda ctx, i: {'username': f'bench-new-{ctx["run"]}-{i}',
+                                                      'phone_number': f'+1{ctx["run"] % 1000:03d}{i:09d}'}),
+    'get_user': Route('get', lambda ctx, i: {'pk': ctx['user']}),
+    'delete_user': Route('delete', lambda ctx, i: {'pk': ctx['spare_users'][i]}),
+    'get_user_spend': Route('get', lambda ctx, i: {'pk': ctx['user']}),
+    'lookup_users': Route('get', query={'phone': '+998 000 000 000'}),
+
+    'list_cards': Route('get'),
+    'create_card': Route('post', body=lambda ctx, i: {'user': ctx['user'], 'card_number': f'9860{i:012d}',
+                                                      'card_type': 'HUMO', 'bank_name': 'bench', 'balance': '10.00'}),
+    'get_card': Route('get', lambda ctx, i: {'pk': ctx['card']}),
+    'update_card': Route('put', lambda ctx, i: {'pk': ctx['card']},
+                         body=lambda ctx, i: {'user': ctx['user'], 'card_number': '8600000000000001',
+                                              'card_type': 'HUMO', 'bank_name': 'bench', 'balance': '10000000.00'}),
+    'delete_card': Route('delete', lambda ctx, i: {'pk': ctx['spare_cards'][i]}),
+    'lookup_cards': Route('get', query={'prefix': '8600 00** **** ****'}),
+
+    'list_merchants': Route('get'),
+    'create_merchant': Route('post', body=lambda ctx, i: {'name': f'bench-{i}', 'phone_number': '+998900000000',
+                                                          'category': {'name': 'bench', 'description': ''}}),
+    'get_merchant': Route('get', lambda ctx, i: {'pk': ctx['merchant']}),
+    'delete_merchant': Route('delete', lambda ctx, i: {'pk': ctx['spare_merchants'][i]}),
+    'catalog_stats': Route('get'),
+    'get_merchant_spend': Route('get', lambda ctx, i: {'pk': ctx['merchant']}),
+    'get_merchant_statement': Route('get', lambda ctx, i: {'pk': ctx['merchant']},
+                                    query={'date_from': '2000-01-01', 'date_to': '2100-12-31'}),
+
+    'list_merchant_categories': Route('get'),
+    'create_merchant_category': Route('post', body=lambda ctx, i: {'name': f'bench-{i}', 'description': ''}),
+    'get_merchant_category': Route('get', lambda ctx, i: {'pk': ctx['category']}),
+    'update_merchant_category': Route('put', lambda ctx, i: {'pk': ctx['category']},
+                                      body=lambda ctx, i: {'name': 'bench', 'description': f'{i}'}),
+    'delete_merchant_category': Route('delete', lambda ctx, i: {'pk': ctx['spare_categories'][i]}),
+    'get_merchant_category_spend': Route('get', lambda ctx, i: {'pk': ctx['category']}),
+
+    'list_transactions': Route('get', query={'limit': 100}),
+    'create_transaction': Route('post', body=_payment),
+    'create_transactions_bulk': Route('post', body=lambda ctx, i: {'transactions': [_payment(ctx, i)] * 100}),
+    'get_transaction': Route('get', lambda ctx, i: {'pk': ctx['transaction']}),
+    'export_transactions': Route('get', query={'output': 'csv', 'merchant': 1}),
+    'delete_transaction': Route('delete', lambda ctx, i: {'pk': ctx['spare_transactions'][i]}),
+    'refund_transaction': Route('post', lambda ctx, i: {'pk': ctx['refundable_transactions'][i]},
+                                body=lambda ctx, i: {'reason': 'bench'}),
+    'refund_transactions_bulk': Route('post', body=lambda ctx, i: {'merchant': ctx['spare_merchants'][i], 'reason': 'bench'}),
+
+    'async_get_card': Route('get', lambda ctx, i: {'pk': ctx['card']}),
+    'async_list_transactions': Route('get', query={'limit': 100}),
+    'async_create_transaction': Route('post', body=_payment),
+    'async_get_transaction': Route('get', lambda ctx, i: {'pk': ctx['transaction']}),
+
+    'token_obtain_pair': Route('post', body=lambda ctx, i: {'username': ctx['username'], 'password': ctx['password']}),
+    'token_refresh': Route('post', body=lambda ctx, i: {'refresh': ctx['refresh']}),
+}
+
+
+DELETE_ORDER = ['delete_transaction', 'delete_card', 'delete_merchant', 'delete_merchant_category', 'delete_user']
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database, drive every route in main/urls.py and report '
+            'throughput, p50/p95/p99 latency and query counts. --save/--compare keep a JSON '
+            'baseline so CI can flag regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--merchants', type=int, default=200)
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--route', action='append', help='Only run these route names.')
+        parser.add_argument('--save', help='Write the report to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON to compare against; exits non-zero on regression.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 slowdown before a route counts as regressed.')
+        parser.add_argument('--keepdb', action='store_true')
+        parser.add_argument('--max-in-flight', type=int,
+                            help='Override PAYMENT_MAX_IN_FLIGHT; payments shed with 503 count as errors.')
+
+    def handle(self, *args, **options):
+        # One bench user pays hundreds of times a minute, which the fraud
+        # velocity rules and the rate limits would rightly decline.
+        overrides = {'FRAUD_CHECKS_ENABLED': False, 'RATE_LIMITS_ENABLED': False}
+        if options['max_in_flight'] is not None:
+            overrides['PAYMENT_MAX_IN_FLIGHT'] = options['max_in_flight'] or None
+        with test_database(keepdb=options['keepdb']), override_settings(**overrides):
+            report = self.run(options)
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = self.compare(json.load(f), report, options['tolerance'])
+            for line in regressions:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}.')
+
+    def run(self, options):
+        requests = options['requests']
+        started = time.perf_counter()
+        volumes = seed(users=options['users'], merchants=options['merchants'],
+                       transactions=options['transactions'], prefix='bench')
+        seeded_in = time.perf_counter() - started
+
+        user = User.objects.order_by('id').first()
+        user.set_password('bench')
+        user.is_staff = True
+        user.save()
+        Card.objects.filter(user=user).update(balance=Decimal('10000000.00'))
+        refresh = RefreshToken.for_user(user)
+        ctx = {
+            'run': int(time.time()),
+            'user': user.id,
+            'username': user.username,
+            'password': 'bench',
+            'refresh': str(refresh),
+            'card': Card.objects.filter(user=user).order_by('id').values_list('id', flat=True).first(),
+            'merchant': Merchant.objects.order_by('id').values_list('id', flat=True).first(),
+            'category': MerchantCategory.objects.order_by('id').values_list('id', flat=True).first(),
+            'transaction': Transaction.objects.order_by('id').values_list('id', flat=True).first(),
+            # +1 for the query-count probe request.
+            'spare_users': list(User.objects.order_by('-id').values_list('id', flat=True)[:requests + 1]),
+            'spare_cards': list(Card.objects.exclude(user=user).order_by('-id').values_list('id', flat=True)[:requests + 1]),
+            'spare_merchants': list(Merchant.objects.order_by('-id').values_list('id', flat=True)[:requests + 1]),
+            'spare_categories': list(MerchantCategory.objects.order_by('-id').values_list('id', flat=True)[:requests + 1]),
+            'spare_transactions': list(Transaction.objects.order_by('-id').values_list('id', flat=True)[:requests + 1]),
+            'refundable_transactions': list(Transaction.objects.order_by('id').values_list('id', flat=True)[1:requests + 2]),
+        }
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {refresh.access_token}'}
+
+        results = {}
+        # Destructive routes go last, children before parents, so cascades
+        # cannot remove objects that a later route still reads.
+        patterns = sorted((p for p in main_urls.urlpatterns if p.name),
+                          key=lambda p: (DELETE_ORDER.index(p.name) if p.name in DELETE_ORDER else -1, p.name))
+        for pattern in patterns:
+            if options['route'] and pattern.name not in options['route']:
+                continue
+            route = ROUTES.get(pattern.name)
+            if route is None:
+                results[pattern.name] = {'skipped': 'no entry in bench_api.ROUTES'}
+                continue
+            results[pattern.name] = self.measure(route, pattern.name, ctx, headers, requests, options['concurrency'])
+            self.stderr.write(f'{pattern.name}: {results[pattern.name]}')
+
+        return {'volumes': volumes, 'seed_seconds': round(seeded_in, 2),
+                'concurrency': options['concurrency'], 'routes': results}
+
+    def measure(self, route, name, ctx, headers, requests, concurrency):
+        def call(client, i):
+            url = reverse(name, kwargs=route.kwargs(ctx, i))
+            kwargs = dict(headers)
+            if route.body is not None:
+                kwargs.update(data=json.dumps(route.body(ctx, i)), content_type='application/json')
+            elif route.query:
+                kwargs['data'] = route.query
+            return getattr(client, route.method)(url, **kwargs)
+
+        probe = Client(raise_request_exception=False)
+        with CaptureQueriesContext(connection) as queries:
+            probe_status = call(probe, requests).status_code
+
+        counter = itertools.count()
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            client = Client(raise_request_exception=False)
+            try:
+                while (i := next(counter)) < requests:
+                    began = time.perf_counter()
+                    response = call(client, i)
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        latencies.append(elapsed)
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, time.perf_counter() - started,
+                         queries=len(queries), status=probe_status, errors=len(errors))
+
+    def compare(self, baseline, report, tolerance):
+        regressions = []
+        for name, current in report['routes'].items():
+            previous = baseline.get('routes', {}).get(name)
+            if not previous or 'skipped' in current or 'skipped' in previous:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(f'{name}: {previous["queries"]} -> {current["queries"]} queries')
+            if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        return regressions
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from main.authentication import CachedJWTAuthentication
+from main.bench import summarize, test_database
+from main.models import User
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request cost of JWTAuthentication, CachedJWTAuthentication and claims-only mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with test_database(keepdb=options['keepdb']):
+            user = User.objects.create(username='bench-auth', phone_number='+998000000000')
+            token = str(AccessToken.for_user(user))
+            factory = RequestFactory()
+
+            cases = [
+                ('simplejwt', JWTAuthentication, False),
+                ('cached', CachedJWTAuthentication, False),
+                ('claims_only', CachedJWTAuthentication, True),
+            ]
+            for name, backend_class, claims_only in cases:
+                backend = backend_class()
+                with override_settings(JWT_AUTH_CLAIMS_ONLY=claims_only), CaptureQueriesContext(connection) as queries:
+                    latencies = []
+                    started = time.perf_counter()
+                    for _ in range(options['iterations']):
+                        request = Request(factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+                        began = time.perf_counter()
+                        backend.authenticate(request)
+                        latencies.append(time.perf_counter() - began)
+                    elapsed = time.perf_counter() - started
+                report = summarize(latencies, elapsed, queries=len(queries))
+                self.stdout.write(json.dumps({'backend': name, **report}))
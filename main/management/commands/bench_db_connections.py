@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Environment overrides for each connection strategy, applied on top of the
+# caller's environment. Each profile runs in its own process because the
+# database settings are read once at startup.
+PROFILES = {
+    'new-connection': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'},
+    'persistent': {'DB_CONN_MAX_AGE': '60', 'DB_POOL': '0'},
+    'pooled': {'DB_POOL': '1'},
+}
+
+READ_ROUTES = ['list_cards', 'get_card', 'get_user', 'list_transactions', 'get_transaction', 'get_user_spend']
+
+
+class Command(BaseCommand):
+    help = ('Run bench_api\'s read routes once per database connection profile (new connection per '
+            'request, persistent, pooled) and report requests/sec for each against the first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                            help='Profiles to run, in order. Defaults to all.')
+        parser.add_argument('--route', action='append', help=f'Routes to run. Defaults to {", ".join(READ_ROUTES)}.')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--merchants', type=int, default=50)
+        parser.add_argument('--transactions', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        profiles = options['profile'] or list(PROFILES)
+        routes = options['route'] or READ_ROUTES
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+
+        results = {}
+        for profile in profiles:
+            with tempfile.NamedTemporaryFile(suffix='.json') as report_file:
+                command = [sys.executable, manage, 'bench_api', '--save', report_file.name,
+                           '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+                           '--users', str(options['users']), '--merchants', str(options['merchants']),
+                           '--transactions', str(options['transactions'])]
+                for route in routes:
+                    command += ['--route', route]
+                self.stderr.write(f'{profile}: running bench_api')
+                completed = subprocess.run(command, env={**os.environ, **PROFILES[profile]},
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                if completed.returncode:
+                    raise CommandError(f'{profile}: bench_api failed\n{completed.stderr}')
+                with open(report_file.name) as f:
+                    report = json.load(f)
+            results[profile] = {name: route['throughput'] for name, route in report['routes'].items()
+                                if 'throughput' in route}
+
+        baseline = results[profiles[0]]
+        summary = {
+            profile: {
+                name: {'rps': rps, 'speedup': round(rps / baseline[name], 2) if baseline.get(name) else None}
+                for name, rps in by_route.items()
+            }
+            for profile, by_route in results.items()
+        }
+        self.stdout.write(json.dumps({'replica': 'replica' in settings.DATABASES,
+                                      'concurrency': options['concurrency'], 'profiles': summary}, indent=2))
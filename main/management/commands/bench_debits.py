@@ -0,0 +1,69 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main import ledger
+from main.models import Card, Merchant, MerchantCategory, Transaction, User
+from main.payments import InsufficientFunds, pay
+
+
+class Command(BaseCommand):
+    help = 'Fire many parallel debits at one card and check the final balance is exact.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--amount', default='1.00')
+        parser.add_argument('--balance', default=None,
+                            help='Starting balance. Defaults to 3/4 of count * amount so some debits must fail.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite serializes writers; run this against PostgreSQL.')
+
+        count = options['count']
+        amount = Decimal(options['amount'])
+        balance = Decimal(options['balance']) if options['balance'] else amount * count * 3 / 4
+
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'bench-{tag}', phone_number=f'+bench{tag}')
+        category = MerchantCategory.objects.create(name=f'bench-{tag}', description='')
+        merchant = Merchant.objects.create(name=f'bench-{tag}', phone_number='', category=category)
+        card = Card.objects.create(user=user, card_number=tag, card_type='HUMO', bank_name='bench', balance=balance)
+
+        def debit(_):
+            try:
+                pay(user, merchant, card, amount, '', 'bench', '127.0.0.1')
+                return True
+            except InsufficientFunds:
+                return False
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                succeeded = sum(pool.map(debit, range(count)))
+            elapsed = time.perf_counter() - started
+
+            final_balance = ledger.balance(card.pk)
+            recorded = Transaction.objects.filter(user=user).count()
+            expected_successes = min(count, int(balance // amount))
+            expected_balance = balance - amount * expected_successes
+
+            self.stdout.write(f'{count} debits in {elapsed:.2f}s ({count / elapsed:.0f}/s), '
+                              f'{succeeded} succeeded, {recorded} recorded')
+            self.stdout.write(f'final balance {final_balance}, expected {expected_balance}')
+            if succeeded != expected_successes or recorded != succeeded or final_balance != expected_balance:
+                raise CommandError('Balance mismatch: lost or duplicated debits.')
+            ledger.compact([card.pk])
+            if ledger.balance(card.pk) != expected_balance or ledger.unbalanced_postings():
+                raise CommandError('Ledger mismatch after compaction.')
+            self.stdout.write(self.style.SUCCESS('Balance exact.'))
+        finally:
+            user.delete()
+            category.delete()
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.bench import summarize
+
+
+class Command(BaseCommand):
+    help = ('Load a running server over HTTP and report throughput and latency percentiles. '
+            'Point one --url at a WSGI server and one at an ASGI server to compare them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True)
+        parser.add_argument('--token', default='', help='JWT access token sent as a Bearer header.')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--body', default=None, help='JSON body for POST requests.')
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--concurrency', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for url in options['url']:
+            report = asyncio.run(self.run(url, options))
+            self.stdout.write(json.dumps({'url': url, **report}))
+
+    async def run(self, url, options):
+        import aiohttp
+
+        headers = {'Authorization': f'Bearer {options["token"]}'} if options['token'] else {}
+        body = json.loads(options['body']) if options['body'] else None
+        remaining = options['requests']
+        latencies = []
+        errors = 0
+
+        async def worker(session):
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    async with session.request(options['method'], url, json=body) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        connector = aiohttp.TCPConnector(limit=options['concurrency'])
+        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(session) for _ in range(options['concurrency'])))
+            elapsed = time.perf_counter() - started
+        return summarize(latencies, elapsed, errors=errors)
@@ -0,0 +1,73 @@
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from main import fast_serializers
+from main.models import Card, Merchant, MerchantCategory, Transaction
+from main.serializers import CardSerializer, MerchantSerializer, TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compare DRF serializers + JSONRenderer with main.fast_serializers on synthetic rows, '
+            'checking the output is byte-for-byte identical. Needs no database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        now = timezone.now()
+        category = MerchantCategory(id=1, name='Grocery', description='Food — ünïcode ok')
+
+        transactions = [
+            (i, i % 1000 + 1, i % 50 + 1, Decimal(i % 100000) / 100, f'998{i:09d}',
+             now - timedelta(seconds=i, microseconds=i % 7 * 1000), f'device-{i % 777}', f'10.0.{i % 256}.{i % 250 + 1}')
+            for i in range(1, count + 1)
+        ]
+        cards = [
+            (i, i % 1000 + 1, f'8600{i:012d}', 'HUMO' if i % 2 else 'UzCard', 'Kapitalbank', Decimal(i) / 100)
+            for i in range(1, count + 1)
+        ]
+        merchants = [(i, f'Shop "{i}"', f'998{i:09d}', 1, category.name, category.description) for i in range(1, count + 1)]
+
+        cases = [
+            ('transactions', transactions, fast_serializers.TRANSACTION, TransactionSerializer,
+             lambda r: Transaction(id=r[0], user_id=r[1], merchant_id=r[2], amount=r[3], phone_number=r[4],
+                                   transaction_date=r[5], device_id=r[6], ip_address=r[7])),
+            ('cards', cards, fast_serializers.CARD, CardSerializer,
+             self.card),
+            ('merchants', merchants, fast_serializers.MERCHANT, MerchantSerializer,
+             lambda r: Merchant(id=r[0], name=r[1], phone_number=r[2], category=category)),
+        ]
+        renderer = JSONRenderer()
+        for name, rows, fast, serializer_class, build in cases:
+            instances = [build(row) for row in rows]
+
+            started = time.perf_counter()
+            expected = renderer.render(serializer_class(instances, many=True).data)
+            drf_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            actual = fast_serializers.render(fast.many(rows))
+            fast_seconds = time.perf_counter() - started
+
+            if actual != expected:
+                raise CommandError(f'{name}: fast output differs from DRF output.')
+            self.stdout.write(json.dumps({
+                'serializer': name,
+                'rows': count,
+                'drf_ms': round(drf_seconds * 1000, 1),
+                'fast_ms': round(fast_seconds * 1000, 1),
+                'speedup': round(drf_seconds / fast_seconds, 1) if fast_seconds else None,
+            }))
+
+    @staticmethod
+    def card(row):
+        card = Card(id=row[0], user_id=row[1], card_number=row[2], card_type=row[3], bank_name=row[4], balance=row[5])
+        card.current_balance = row[5]
+        return card
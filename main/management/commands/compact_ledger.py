@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import ledger
+
+
+class Command(BaseCommand):
+    help = ('Fold pending ledger entries into balance snapshots. Run it every few minutes '
+            'so card balances stay cheap to compute.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--card', type=int, action='append', dest='cards',
+                            help='Only compact this card. Repeat for several.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--verify', action='store_true',
+                            help='Also check that every posting sums to zero.')
+
+    def handle(self, *args, **options):
+        compacted = ledger.compact(options['cards'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} cards.'))
+        if options['verify']:
+            unbalanced = ledger.unbalanced_postings()
+            if unbalanced:
+                raise CommandError(f'{len(unbalanced)} unbalanced postings, e.g. {unbalanced[0]}.')
+            self.stdout.write(self.style.SUCCESS('All postings balance.'))
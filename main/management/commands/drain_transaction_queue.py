@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from main.writebehind import get_queue, get_writer
+
+
+class Command(BaseCommand):
+    help = ('Write every queued write-behind transaction to the database now, e.g. before '
+            'shutting a node down or after a crash left rows in the local queue.')
+
+    def handle(self, *args, **options):
+        inserted = get_writer().drain()
+        queue = get_queue()
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted {inserted} transactions; {queue.pending()} still queued '
+            f'(oldest {queue.oldest_age():.0f}s, waiting on uncommitted reservations).'
+        ))
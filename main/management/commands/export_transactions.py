@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import export
+
+
+class Command(BaseCommand):
+    help = 'Write transactions joined with merchant and category to a Parquet, Arrow or gzip CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--output', choices=sorted(export.CONTENT_TYPES), default=None)
+        parser.add_argument('--date-from')
+        parser.add_argument('--date-to')
+        parser.add_argument('--merchant')
+        parser.add_argument('--user')
+        parser.add_argument('--chunk-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        output = options['output'] or export.default_format()
+        if output != 'csv' and not export.pyarrow_available():
+            raise CommandError(f'{output} export needs pyarrow; use --output csv.')
+
+        params = {key: options[option] for key, option in [
+            ('date_from', 'date_from'), ('date_to', 'date_to'), ('merchant', 'merchant'), ('user', 'user'),
+        ] if options[option]}
+        written = 0
+        with open(options['path'], 'wb') as f:
+            for data in export.stream(params, output, options['chunk_size']):
+                f.write(data)
+                written += len(data)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes of {output} to {options["path"]}.'))
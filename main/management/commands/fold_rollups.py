@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import rollups
+
+
+class Command(BaseCommand):
+    help = ('Fold journalled merchant and category spend into the daily rollups. Reads are '
+            'correct either way; run it every minute or so to keep the journal short.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, folding every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            folded = 0
+            while batch := rollups.fold(options['batch_size']):
+                folded += batch
+            self.stdout.write(self.style.SUCCESS(f'Folded {folded} spend deltas.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
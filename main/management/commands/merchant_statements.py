@@ -0,0 +1,58 @@
+import gzip
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from main import statements
+from main.models import Merchant, MerchantDailySpend, SpendDelta
+from main.partitions import next_month
+
+
+class Command(BaseCommand):
+    help = ('Write one gzip NDJSON statement per merchant for a period: the summary line, '
+            'then every transaction. Defaults to every merchant with activity in the period.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='.')
+        parser.add_argument('--merchant', type=int, action='append', dest='merchants')
+        period = parser.add_mutually_exclusive_group(required=True)
+        period.add_argument('--month', help='YYYY-MM.')
+        period.add_argument('--date-from', help='YYYY-MM-DD, with --date-to; both inclusive.')
+        parser.add_argument('--date-to')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        date_from, date_to = self.period(options)
+        merchant_ids = options['merchants'] or sorted({
+            merchant_id
+            for model in (MerchantDailySpend, SpendDelta)
+            for merchant_id in model.objects.filter(date__gte=date_from, date__lte=date_to)
+            .order_by().values_list('merchant_id', flat=True).distinct()
+        })
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        written = 0
+        for merchant in Merchant.objects.select_related('category').filter(pk__in=merchant_ids).order_by('pk'):
+            path = os.path.join(options['output_dir'],
+                                f'statement-{merchant.pk}-{date_from:%Y%m%d}-{date_to:%Y%m%d}.ndjson.gz')
+            with gzip.open(path, 'wb') as f:
+                for data in statements.iter_ndjson(merchant, date_from, date_to, options['chunk_size']):
+                    f.write(data)
+            written += 1
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} statements to {options["output_dir"]}.'))
+
+    def period(self, options):
+        if options['month']:
+            try:
+                year, month = map(int, options['month'].split('-'))
+                start = date(year, month, 1)
+            except ValueError:
+                raise CommandError('--month must be YYYY-MM.')
+            return start, date.fromordinal(next_month(start).toordinal() - 1)
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'] or '')
+        if date_from is None or date_to is None or date_from > date_to:
+            raise CommandError('--date-from and --date-to must be YYYY-MM-DD, in order.')
+        return date_from, date_to
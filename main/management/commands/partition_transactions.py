@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import partitions
+
+
+class Command(BaseCommand):
+    help = ('Partition the transactions table by month (PostgreSQL) and keep partitions '
+            'created ahead of time. Safe to run repeatedly, e.g. from a monthly cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not partitions.supported():
+            self.stdout.write('Partitioning needs PostgreSQL; leaving the transactions table as a plain table.')
+            return
+
+        if partitions.is_partitioned():
+            today = timezone.localdate()
+            existing = partitions.partitions()
+            start = max(existing[-1][2], partitions.month_start(today)) if existing else today
+            months = (today.year - start.year) * 12 + today.month - start.month + 1 + options['months_ahead']
+            created = partitions.ensure_partitions(start, months)
+        else:
+            created = partitions.convert(options['months_ahead'])
+
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        self.stdout.write(self.style.SUCCESS('Transactions table is partitioned.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import refunds
+from main.models import ArchivedTransaction, Transaction
+from main.pagination import filter_transactions
+
+
+class Command(BaseCommand):
+    help = ('Refund every transaction of a merchant and/or time window, in chunked batches. '
+            'Already refunded transactions are skipped, so it is safe to re-run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchant', type=int)
+        parser.add_argument('--user', type=int)
+        parser.add_argument('--date-from', help='ISO datetime, inclusive.')
+        parser.add_argument('--date-to', help='ISO datetime, exclusive.')
+        parser.add_argument('--reason', default='')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in ('merchant', 'user', 'date_from', 'date_to') if options[key]}
+        if not (params.get('merchant') or params.get('date_from') or params.get('date_to')):
+            raise CommandError('Pass --merchant or a --date-from/--date-to window.')
+        try:
+            querysets = [filter_transactions(model.objects.all(), params) for model in (Transaction, ArchivedTransaction)]
+        except ValueError as e:
+            raise CommandError(str(e))
+        refunded = sum(refunds.reverse(queryset, reason=options['reason'], chunk_size=options['chunk_size'])
+                       for queryset in querysets)
+        self.stdout.write(self.style.SUCCESS(f'Refunded {refunded} transactions.'))
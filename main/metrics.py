@@ -0,0 +1,98 @@
+import bisect
+import threading
+from collections import defaultdict
+
+
+# Upper bounds in seconds, Prometheus-style.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Process-local metric store rendered in the Prometheus text format.
+
+    Histograms and HTTP counters are keyed by (name, endpoint); counters for
+    other components take their own label name, or none. Other modules can
+    add gauges computed at scrape time with register_gauge().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._help = {}
+        self._labels = {}
+        self._gauges = {}
+
+    def observe(self, name, endpoint, value, help_text=''):
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            histogram = self._histograms[name].get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[name][endpoint] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, endpoint, value=1, help_text='', label='endpoint'):
+        """
+        Add value to a counter. endpoint is the value of its label named label; None leaves it unlabelled.
+        """
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            self._labels.setdefault(name, label)
+            self._counters[name][endpoint] += value
+
+    def register_gauge(self, name, help_text, func):
+        """
+        Report func() as a gauge on every scrape. func returns a number or {label: number}.
+        """
+        self._gauges[name] = (help_text, func)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, by_endpoint in sorted(self._histograms.items()):
+                lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, histogram in sorted(by_endpoint.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+            for name, by_endpoint in sorted(self._counters.items()):
+                lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                label = self._labels[name]
+                for endpoint, value in sorted(by_endpoint.items()):
+                    if endpoint is None:
+                        lines.append(f'{name} {value}')
+                    else:
+                        lines.append(f'{name}{{{label}="{endpoint}"}} {value}')
+        for name, (help_text, func) in sorted(self._gauges.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            value = func()
+            if isinstance(value, dict):
+                for label, item in sorted(value.items()):
+                    lines.append(f'{name}{{kind="{label}"}} {item}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,174 @@
+import cProfile
+import heapq
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import registry
+
+
+class QueryTimer:
+    """
+    Counts queries and time spent in the database for one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class SlowestProfiles:
+    """
+    Keeps cProfile dumps of the N slowest sampled requests in PROFILE_DIR.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def offer(self, profile, duration, endpoint):
+        keep = getattr(settings, 'PROFILE_KEEP_SLOWEST', 20)
+        with self._lock:
+            if len(self._heap) >= keep and duration <= self._heap[0][0]:
+                return
+            directory = getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{duration * 1000:010.1f}ms-{endpoint.replace(":", "_")}-{time.time_ns()}.prof')
+            profile.dump_stats(path)
+            heapq.heappush(self._heap, (duration, path))
+            if len(self._heap) > keep:
+                _, evicted = heapq.heappop(self._heap)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+
+slowest_profiles = SlowestProfiles()
+
+# The timer of the request being served. Connections are per thread, and an
+# async request's queries run on sync_to_async's threads rather than the
+# event loop's, so every connection carries the same wrapper and finds the
+# timer here: sync_to_async copies the context into the thread it runs on.
+_current_timer = ContextVar('query_timer', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+connection_created.connect(install_query_timer)
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    """
+    Records per-endpoint latency, DB query count/time and render time.
+
+    With PROFILE_SAMPLE_RATE > 0 a matching share of requests runs under
+    cProfile and the slowest ones are dumped to PROFILE_DIR. This only works
+    in sync mode: cProfile follows one thread, and an async request's work is
+    spread over the event loop and sync_to_async's threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self._sampled = 0
+        # Connections opened before this module was imported missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timer = QueryTimer()
+        profile = self._maybe_profile()
+        started = time.perf_counter()
+        token = _current_timer.set(timer)
+        if profile is not None:
+            profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profile is not None:
+                profile.disable()
+            _current_timer.reset(token)
+        duration = time.perf_counter() - started
+        self._record(request, response, duration, timer)
+        if profile is not None:
+            slowest_profiles.offer(profile, duration, _endpoint(request))
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        token = _current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        self._record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF Responses are rendered after the view returns; time that step.
+        started = time.perf_counter()
+
+        def rendered(response):
+            registry.observe('http_render_seconds', _endpoint(request), time.perf_counter() - started,
+                             'Time spent rendering (serializing) the response body.')
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def _maybe_profile(self):
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if not rate:
+            return None
+        self._sampled += 1
+        if self._sampled * rate < 1:
+            return None
+        self._sampled = 0
+        return cProfile.Profile()
+
+    def _record(self, request, response, duration, timer):
+        endpoint = _endpoint(request)
+        registry.observe('http_request_seconds', endpoint, duration, 'Request latency.')
+        registry.observe('http_db_seconds', endpoint, timer.seconds, 'Time spent in database queries per request.')
+        registry.inc('http_requests_total', endpoint, help_text='Requests served.')
+        registry.inc('http_db_queries_total', endpoint, timer.count, help_text='Database queries executed.')
+        if response.status_code >= 500:
+            registry.inc('http_errors_total', endpoint, help_text='Responses with a 5xx status.')
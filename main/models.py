@@ -1,8 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from .fields import BinPrefixField, DigitsField, PanHashField
+
 class User(AbstractUser):
-    phone_number = models.CharField(max_length=15, unique=True)
+    phone_number = DigitsField(max_length=15, unique=True)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -22,7 +24,9 @@ class User(AbstractUser):
 
 class Card(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    card_number = models.CharField(max_length=20)
+    card_number = DigitsField(max_length=20)
+    card_number_hash = PanHashField(max_length=64, source='card_number', db_index=True)
+    bin_prefix = BinPrefixField(max_length=8, source='card_number', db_index=True)
     card_type = models.CharField(choices=[('HUMO', 'HUMO'), ('UzCard', 'UzCard')], max_length=10)
     bank_name = models.CharField(max_length=100)
     balance = models.DecimalField(max_digits=10, decimal_places=2)
@@ -52,10 +56,192 @@ class Transaction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    phone_number = models.CharField(max_length=20)
+    phone_number = DigitsField(max_length=20, db_index=True)
     transaction_date = models.DateTimeField(auto_now_add=True)
     device_id = models.CharField(max_length=100)
     ip_address = models.GenericIPAddressField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['transaction_date', 'id'], name='txn_date_id_idx'),
+            models.Index(fields=['user', 'transaction_date', 'id'], name='txn_user_date_id_idx'),
+            models.Index(fields=['merchant', 'transaction_date', 'id'], name='txn_merchant_date_id_idx'),
+        ]
+
     def __str__(self):
         return f'Transaction: {self.id} - {self.user.username}'
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Cold Transaction rows moved out by the archive_transactions command.
+
+    Keeps the original id and columns, so the read endpoints can serve both
+    tables through the same serializer and cursor.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, related_name='archived_transactions')
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, db_constraint=False, related_name='archived_transactions')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    phone_number = DigitsField(max_length=20, db_index=True)
+    transaction_date = models.DateTimeField()
+    device_id = models.CharField(max_length=100)
+    ip_address = models.GenericIPAddressField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['transaction_date', 'id'], name='archived_txn_date_id_idx'),
+            models.Index(fields=['user', 'transaction_date', 'id'], name='archived_txn_user_date_idx'),
+            models.Index(fields=['merchant', 'transaction_date', 'id'], name='archived_txn_merch_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Archived transaction: {self.id}'
+
+
+class Refund(models.Model):
+    """
+    Compensating record for a reversed Transaction. The transaction row is
+    kept for audit; its money goes back to the card through the ledger.
+    """
+    transaction_id = models.BigIntegerField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='refunds')
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='refunds')
+    card = models.ForeignKey(Card, on_delete=models.SET_NULL, null=True, related_name='refunds')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_date = models.DateTimeField()
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['merchant', 'created_at'], name='refund_merchant_date_idx'),
+            models.Index(fields=['merchant', 'transaction_date'], name='refund_merchant_txn_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Refund of {self.transaction_id}'
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # sha256 of the request body, so a key reused for a different request is refused.
+    request_fingerprint = models.CharField(max_length=64, default='')
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.key}'
+
+
+class BalanceSnapshot(models.Model):
+    """
+    A card's balance after folding in every ledger entry that points at this snapshot.
+    """
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='snapshots')
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['card', 'last_entry_id'], name='snapshot_card_entry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.card_id}: {self.balance}'
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a double-entry posting. Entries sharing a posting sum to zero;
+    a leg with neither card nor merchant belongs to the external account.
+    Rows are only ever inserted, apart from snapshot being set by compaction.
+    """
+    PAYMENT = 'payment'
+    REFUND = 'refund'
+    DEPOSIT = 'deposit'
+    ADJUSTMENT = 'adjustment'
+
+    posting = models.UUIDField(db_index=True)
+    kind = models.CharField(max_length=20, choices=[(PAYMENT, 'Payment'), (REFUND, 'Refund'),
+                                                    (DEPOSIT, 'Deposit'), (ADJUSTMENT, 'Adjustment')])
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, null=True, related_name='ledger_entries')
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, null=True, related_name='ledger_entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    transaction_id = models.BigIntegerField(null=True, db_index=True)
+    snapshot = models.ForeignKey(BalanceSnapshot, on_delete=models.CASCADE, null=True, related_name='entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['card', 'id'], name='ledger_pending_idx', condition=models.Q(snapshot__isnull=True)),
+            models.Index(fields=['merchant', 'created_at'], name='ledger_merchant_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.amount}'
+
+
+class DailySpend(models.Model):
+    date = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class UserDailySpend(DailySpend):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='user_daily_spend_uniq'),
+        ]
+
+
+class MerchantDailySpend(DailySpend):
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'date'], name='merchant_daily_spend_uniq'),
+        ]
+
+
+class CategoryDailySpend(DailySpend):
+    category = models.ForeignKey(MerchantCategory, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'date'], name='category_daily_spend_uniq'),
+        ]
+
+
+class SpendDelta(models.Model):
+    """
+    Merchant and category spend not yet folded into their daily rollups.
+
+    Payments only INSERT here, so concurrent payments to one merchant never
+    wait on its rollup row; main.rollups.fold moves the rows into
+    MerchantDailySpend/CategoryDailySpend and reads add what is left.
+    """
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE)
+    category = models.ForeignKey(MerchantCategory, on_delete=models.CASCADE)
+    date = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    count = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['merchant', 'date'], name='spend_delta_merchant_idx'),
+            models.Index(fields=['category', 'date'], name='spend_delta_category_idx'),
+        ]
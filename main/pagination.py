@@ -0,0 +1,178 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(transaction_date, pk):
+    """
+    Encode a (transaction_date, id) keyset position as an opaque token.
+    """
+    raw = f'{transaction_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a token produced by encode_cursor back into (transaction_date, id).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_part, pk_part = raw.rsplit('|', 1)
+        transaction_date = parse_datetime(date_part)
+        pk = int(pk_part)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor.')
+    if transaction_date is None:
+        raise InvalidCursor('Invalid cursor.')
+    return transaction_date, pk
+
+
+def get_page_size(params):
+    """
+    Read ?limit= from the query parameters, clamped to MAX_PAGE_SIZE.
+    """
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def get_fieldset(params):
+    """
+    Read ?fields= and ?expand= (comma-separated names) from the query parameters.
+    fields is None when not given, meaning every field.
+    """
+    def names(key):
+        return [name.strip() for name in params.get(key, '').split(',') if name.strip()]
+    return (names('fields') if 'fields' in params else None), names('expand')
+
+
+def filter_transactions(queryset, params):
+    """
+    Apply the user/merchant/phone/date range filters shared by the list and export paths.
+    """
+    user_id = params.get('user')
+    merchant_id = params.get('merchant')
+    phone_number = params.get('phone')
+    date_from = params.get('date_from')
+    date_to = params.get('date_to')
+
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    if merchant_id:
+        queryset = queryset.filter(merchant_id=merchant_id)
+    if phone_number:
+        queryset = queryset.filter(phone_number=phone_number)
+    if date_from:
+        parsed = parse_datetime(date_from)
+        if parsed is None:
+            raise ValueError('Invalid date_from.')
+        queryset = queryset.filter(transaction_date__gte=parsed)
+    if date_to:
+        parsed = parse_datetime(date_to)
+        if parsed is None:
+            raise ValueError('Invalid date_to.')
+        queryset = queryset.filter(transaction_date__lt=parsed)
+    return queryset
+
+
+def seek(queryset, cursor):
+    """
+    Order transactions newest first and skip everything up to the cursor.
+
+    Seeks with a (transaction_date, id) comparison so each page is an index
+    range scan instead of an OFFSET.
+    """
+    queryset = queryset.order_by('-transaction_date', '-id')
+    if cursor:
+        transaction_date, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(transaction_date__lt=transaction_date) |
+            Q(transaction_date=transaction_date, id__lt=pk)
+        )
+    return queryset
+
+
+def split_page(rows, page_size, position=None):
+    """
+    Trim the extra lookahead row fetched by the caller and build the next cursor.
+
+    position maps a row to its (transaction_date, id); by default rows are
+    model instances.
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    if position is None:
+        return rows, encode_cursor(rows[-1].transaction_date, rows[-1].id)
+    return rows, encode_cursor(*position(rows[-1]))
+
+
+def _values(queryset, values):
+    return queryset.values_list(*values) if values else queryset
+
+
+def _position(values):
+    if not values:
+        return None
+    date_index, id_index = values.index('transaction_date'), values.index('id')
+    return lambda row: (row[date_index], row[id_index])
+
+
+def keyset_page(queryset, cursor, page_size, *older, values=None):
+    """
+    Return one page of transactions ordered newest first, plus the next cursor.
+
+    Querysets in older hold strictly older rows (e.g. the archive table) and
+    are only read once queryset runs out, so one cursor walks across all of
+    them. With values, rows are values_list tuples of those lookups, which
+    must include transaction_date and id.
+    """
+    rows = list(_values(seek(queryset, cursor), values)[:page_size + 1])
+    for queryset in older:
+        if len(rows) > page_size:
+            break
+        rows.extend(_values(seek(queryset, cursor), values)[:page_size + 1 - len(rows)])
+    return split_page(rows, page_size, _position(values))
+
+
+async def akeyset_page(queryset, cursor, page_size, *older, values=None):
+    """
+    Async version of keyset_page.
+    """
+    rows = [row async for row in _values(seek(queryset, cursor), values)[:page_size + 1]]
+    for queryset in older:
+        if len(rows) > page_size:
+            break
+        rows.extend([row async for row in _values(seek(queryset, cursor), values)[:page_size + 1 - len(rows)]])
+    return split_page(rows, page_size, _position(values))
+
+
+def iter_ndjson(queryset, serializer_class, chunk_size=2000, **options):
+    """
+    Yield one JSON document per line, reading the queryset with a server-side cursor.
+    options are passed to serializer_class.
+    """
+    encoder = JSONEncoder()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield encoder.encode(serializer_class(obj, **options).data) + '\n'
+
+
+async def aiter_ndjson(queryset, serializer_class, chunk_size=2000, **options):
+    """
+    Async version of iter_ndjson, reading rows with aiterator().
+    """
+    encoder = JSONEncoder()
+    async for obj in queryset.aiterator(chunk_size=chunk_size):
+        yield encoder.encode(serializer_class(obj, **options).data) + '\n'
@@ -0,0 +1,164 @@
+from datetime import date
+
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+from .models import Transaction
+
+
+# Native range partitioning of the transactions table by month on
+# transaction_date. PostgreSQL only; on other backends every function here
+# reports that partitioning is unsupported and the table stays a plain table.
+
+
+def supported():
+    return connection.vendor == 'postgresql'
+
+
+def table():
+    return Transaction._meta.db_table
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{table()}_{month:%Y_%m}'
+
+
+def is_partitioned():
+    if not supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", [table()])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions():
+    """
+    Return [(name, lower, upper)] for the monthly partitions, oldest first. The default partition is left out.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [table()],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            continue
+        # FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-02-01 00:00:00+00')
+        lower, upper = [part.split("'")[1][:10] for part in bound.split(' TO ')]
+        result.append((name, date.fromisoformat(lower), date.fromisoformat(upper)))
+    return sorted(result, key=lambda item: item[1])
+
+
+def ensure_partitions(start, months):
+    """
+    Create monthly partitions from start's month for the given number of months, skipping existing ones.
+    """
+    created = []
+    existing = {name for name, _, _ in partitions()}
+    month = month_start(start)
+    with connection.cursor() as cursor:
+        for _ in range(months):
+            name = partition_name(month)
+            if name not in existing:
+                cursor.execute(
+                    f'CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF {connection.ops.quote_name(table())} '
+                    'FOR VALUES FROM (%s) TO (%s)',
+                    [month.isoformat(), next_month(month).isoformat()],
+                )
+                created.append(name)
+            month = next_month(month)
+    return created
+
+
+def convert(months_ahead=3):
+    """
+    Turn the plain transactions table into a table partitioned by month.
+
+    Existing rows are not rewritten: the old table is attached as the DEFAULT
+    partition and monthly partitions start after its newest row, so the
+    switch is a metadata change apart from one index build. The primary key
+    becomes (id, transaction_date) as PostgreSQL requires, on the old table
+    too so it can be attached; ids keep coming from one sequence.
+    """
+    quote = connection.ops.quote_name
+    name = table()
+    legacy = f'{name}_legacy'
+    sequence = f'{name}_id_seq'
+
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [name])
+        indexes = [(index, definition) for index, definition in cursor.fetchall() if 'UNIQUE' not in definition]
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [name],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0), MAX(transaction_date) FROM {quote(name)}')
+        max_id, newest = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {quote(name)} RENAME TO {quote(legacy)}')
+        cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [legacy])
+        for (index,) in cursor.fetchall():
+            cursor.execute(f'ALTER INDEX {quote(index)} RENAME TO {quote(index[:56] + "_legacy")}')
+        cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP DEFAULT')
+        # A partition's primary key must match its parent's, so the old (id) key makes way for one
+        # that ATTACH PARTITION adopts instead of building its own.
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [legacy])
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {quote(legacy)} DROP CONSTRAINT {quote(constraint)}')
+        cursor.execute(f'ALTER TABLE {quote(legacy)} ADD PRIMARY KEY (id, transaction_date)')
+
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                       'PARTITION BY RANGE (transaction_date)')
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {quote(sequence)}')
+        cursor.execute('SELECT setval(%s, %s, false)', [sequence, max_id + 1])
+        cursor.execute(f"ALTER TABLE {quote(name)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(name)}.id')
+        cursor.execute(f'ALTER TABLE {quote(name)} ADD PRIMARY KEY (id, transaction_date)')
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for constraint, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(name)} ADD CONSTRAINT {quote(constraint[:56] + "_part")} {definition}')
+
+        cursor.execute(f'ALTER TABLE {quote(name)} ATTACH PARTITION {quote(legacy)} DEFAULT')
+
+    first = next_month(timezone.localtime(newest).date()) if newest else month_start(timezone.localdate())
+    return ensure_partitions(first, months_ahead)
+
+
+def drop_empty_before(cutoff):
+    """
+    Drop monthly partitions that end on or before cutoff and hold no rows.
+    """
+    quote = connection.ops.quote_name
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, _, upper in partitions():
+            if upper > cutoff:
+                break
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(name)})')
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(f'ALTER TABLE {quote(table())} DETACH PARTITION {quote(name)}')
+            cursor.execute(f'DROP TABLE {quote(name)}')
+            dropped.append(name)
+    return dropped
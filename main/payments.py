@@ -0,0 +1,149 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from . import ledger, rollups, routing
+from .fraud import get_engine
+from .ledger import InsufficientFunds  # noqa: F401
+from .models import Card, LedgerEntry, Merchant, Transaction
+
+
+def parse_amount(value):
+    """
+    Convert a request amount into a positive Decimal, or None if it is not one.
+    """
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not amount.is_finite() or amount <= 0:
+        return None
+    return amount
+
+
+def debit_card(card_id, amount, merchant_id=None, transaction_id=None):
+    """
+    Take amount from a card by posting ledger entries.
+
+    Debits against one card are serialized by a per-card lock and checked
+    against the ledger balance, so they never overdraw. Raises
+    InsufficientFunds when the balance does not cover amount.
+    """
+    with db_transaction.atomic():
+        ledger.debit(card_id, amount, merchant_id, transaction_id)
+
+
+def credit_card(card_id, amount, merchant_id=None, transaction_id=None):
+    """
+    Add amount to a card. Only inserts ledger entries, so it never waits on debits.
+    """
+    ledger.credit(card_id, amount, merchant_id, transaction_id)
+
+
+def pay(user, merchant, card, amount, phone_number, device_id, ip_address, debits=None):
+    """
+    Record the transaction and debit the card in one database transaction.
+
+    debits, a list of (card_id, amount) summing to amount, splits the payment
+    over several cards instead; either every debit lands or none does. A
+    missing device_id is stored as '', as in pay_batch and write-behind.
+    """
+    debits = debits or [(card.pk, amount)]
+    with db_transaction.atomic():
+        ledger.lock(card_id for card_id, _ in debits)
+        transaction = Transaction.objects.create(
+            user=user,
+            merchant=merchant,
+            amount=amount,
+            phone_number=phone_number,
+            device_id=device_id or '',
+            ip_address=ip_address
+        )
+        for card_id, share in debits:
+            ledger.debit(card_id, share, merchant.pk, transaction.pk)
+        rollups.apply([rollups.row_for(transaction, merchant.category_id)])
+        return transaction
+
+
+MAX_BATCH_SIZE = 5000
+
+
+def pay_batch(user, items, ip_address):
+    """
+    Validate and record many payments for one user in a fixed number of queries.
+
+    Merchants and cards are fetched with one query each, the user's cards are
+    locked once, and every accepted row and its ledger entries go in through
+    bulk_create. Each item is routed to card(s) like a single payment and
+    scored by the fraud engine, the batch counting as one velocity event.
+    Returns one result dict per item, in order.
+    """
+    results = [None] * len(items)
+    parsed = []
+    fraud = get_engine().batch(user.pk, ip_address) if getattr(settings, 'FRAUD_CHECKS_ENABLED', True) else None
+
+    merchant_ids = {_to_int(item.get('merchant_id')) for item in items if isinstance(item, dict)}
+    merchants = Merchant.objects.in_bulk([m for m in merchant_ids if m])
+
+    with db_transaction.atomic():
+        ledger.lock(Card.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        cards = list(ledger.with_balance(Card.objects.filter(user=user)).order_by('id'))
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'error': 'Item must be an object.'}
+                continue
+            amount = parse_amount(item.get('amount'))
+            if not item.get('merchant_id') or amount is None or not item.get('phone_number'):
+                results[index] = {'index': index, 'error': 'Merchant ID, amount, and phone number are required.'}
+                continue
+            merchant = merchants.get(_to_int(item.get('merchant_id')))
+            if merchant is None:
+                results[index] = {'index': index, 'error': 'Merchant not found.'}
+                continue
+            try:
+                route = routing.choose_for(cards, amount, item)
+            except routing.RoutingError as e:
+                results[index] = {'index': index, 'error': str(e)}
+                continue
+            if fraud is not None:
+                assessment = fraud.assess(route.card.pk, item.get('device_id'), amount)
+                if assessment.blocked:
+                    results[index] = {'index': index, 'error': 'Transaction declined.', 'reasons': assessment.reasons}
+                    continue
+
+            # Later items are routed against what this one leaves.
+            for card, share in route.legs:
+                card.current_balance -= share
+            parsed.append((index, route.debits(), Transaction(
+                user=user,
+                merchant=merchant,
+                amount=amount,
+                phone_number=item.get('phone_number'),
+                device_id=item.get('device_id') or '',
+                ip_address=ip_address
+            )))
+
+        created = Transaction.objects.bulk_create([row for _, _, row in parsed])
+
+        ledger.post([
+            entry
+            for (_, debits, _), row in zip(parsed, created)
+            for card_id, share in debits
+            for entry in ledger.legs(LedgerEntry.PAYMENT, share, ledger.card(card_id),
+                                     ledger.merchant(row.merchant_id), row.id)
+        ])
+
+        rollups.apply(rollups.row_for(row, row.merchant.category_id) for row in created)
+
+    for (index, _, _), row in zip(parsed, created):
+        results[index] = {'index': index, 'transaction_id': row.id}
+    return results
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
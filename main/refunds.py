@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.db import transaction as db_transaction
+
+from . import ledger, rollups
+from .models import ArchivedTransaction, Card, LedgerEntry, Refund, Transaction
+
+
+class AlreadyRefunded(Exception):
+    pass
+
+
+class NoRefundTarget(Exception):
+    pass
+
+
+def _transactions(ids, user_id=None):
+    """
+    Live and archived transactions among ids, optionally only user_id's.
+    """
+    owned = {'user_id': user_id} if user_id is not None else {}
+    return [model.objects.filter(pk__in=ids, **owned) for model in (Transaction, ArchivedTransaction)]
+
+
+def _reverse(ids, reason, user_id=None):
+    """
+    Refund whichever of ids are not refunded yet and return the new Refund rows.
+
+    A fixed number of statements per call whatever len(ids) is: the
+    transactions are locked, the refunds and their ledger legs are each one
+    bulk INSERT, and the rollups get one grouped UPDATE per key and day.
+    Payments with no card to return the money to are left alone.
+    """
+    with db_transaction.atomic():
+        rows = [row for queryset in _transactions(ids, user_id)
+                for row in queryset.select_for_update(of=('self',))
+                .values_list('id', 'user_id', 'merchant_id', 'merchant__category_id', 'amount', 'transaction_date')]
+        refunded = set(Refund.objects.filter(transaction_id__in=ids).values_list('transaction_id', flat=True))
+        rows = [row for row in rows if row[0] not in refunded]
+        if not rows:
+            return []
+
+        # Refund each card what it paid (a split payment has several); payments
+        # made before the ledger existed go back to the user's first card, and
+        # are not refunded when there is none rather than leave the system.
+        paid_from = defaultdict(list)
+        for txn_id, card_id, amount in (LedgerEntry.objects.filter(transaction_id__in=[row[0] for row in rows],
+                                                                   kind=LedgerEntry.PAYMENT, card__isnull=False)
+                                        .order_by('id').values_list('transaction_id', 'card_id', 'amount')):
+            paid_from[txn_id].append((card_id, -amount))
+        first_cards = dict(Card.objects.filter(user_id__in={row[1] for row in rows if row[0] not in paid_from})
+                           .order_by('user_id', '-id').values_list('user_id', 'id'))
+        for txn_id, owner_id, _, _, amount, _ in rows:
+            if txn_id not in paid_from and owner_id in first_cards:
+                paid_from[txn_id] = [(first_cards[owner_id], amount)]
+        rows = [row for row in rows if row[0] in paid_from]
+        if not rows:
+            return []
+
+        refunds = Refund.objects.bulk_create([
+            Refund(transaction_id=txn_id, user_id=owner_id, merchant_id=merchant_id,
+                   card_id=paid_from[txn_id][0][0], amount=amount,
+                   transaction_date=transaction_date, reason=reason)
+            for txn_id, owner_id, merchant_id, _, amount, transaction_date in rows
+        ])
+        ledger.post([
+            entry
+            for refund in refunds
+            for card_id, share in paid_from[refund.transaction_id]
+            for entry in ledger.legs(LedgerEntry.REFUND, share, ledger.merchant(refund.merchant_id),
+                                     ledger.card(card_id), refund.transaction_id)
+        ])
+        rollups.apply((rollups.to_row(owner_id, merchant_id, category_id, transaction_date, amount)
+                       for _, owner_id, merchant_id, category_id, amount, transaction_date in rows), sign=-1)
+        return refunds
+
+
+def refund(transaction_id, reason='', user_id=None):
+    """
+    Reverse one live or archived transaction, only if it is user_id's when given.
+    Raises AlreadyRefunded, NoRefundTarget or Transaction.DoesNotExist.
+    """
+    created = _reverse([transaction_id], reason, user_id)
+    if created:
+        return created[0]
+    if not any(queryset.exists() for queryset in _transactions([transaction_id], user_id)):
+        raise Transaction.DoesNotExist('Transaction matching query does not exist.')
+    if Refund.objects.filter(transaction_id=transaction_id).exists():
+        raise AlreadyRefunded('Transaction already refunded.')
+    raise NoRefundTarget('The paying user has no card to refund to.')
+
+
+def reverse(queryset, reason='', chunk_size=1000):
+    """
+    Refund every transaction in queryset, chunk_size ids per database transaction.
+
+    Walks the ids in keyset order so each chunk is an index range scan, and
+    rows refunded earlier (or concurrently) are skipped. Returns the number refunded.
+    """
+    refunded = 0
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return refunded
+        refunded += len(_reverse(ids, reason))
+        last_id = ids[-1]
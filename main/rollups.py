@@ -0,0 +1,129 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .fast_serializers import decimal_field
+from .models import CategoryDailySpend, MerchantDailySpend, SpendDelta, UserDailySpend
+
+
+# (model, key field) for each rollup dimension, in the order of the ids in a row.
+DIMENSIONS = (
+    (UserDailySpend, 'user_id'),
+    (MerchantDailySpend, 'merchant_id'),
+    (CategoryDailySpend, 'category_id'),
+)
+
+# Every payment to a merchant would otherwise UPDATE the same merchant and
+# category row for the day, serializing them all; these two are journalled
+# in SpendDelta instead and folded in later. A user's own payments already
+# serialize on their card lock, so user rows are updated in place.
+JOURNALLED = (MerchantDailySpend, CategoryDailySpend)
+
+money = decimal_field(2)
+
+
+def to_row(user_id, merchant_id, category_id, transaction_date, amount):
+    """
+    Build the (ids, day, amount) tuple that apply() consumes.
+    """
+    return (user_id, merchant_id, category_id), timezone.localtime(transaction_date).date(), amount
+
+
+def row_for(transaction, category_id):
+    return to_row(transaction.user_id, transaction.merchant_id, category_id,
+                  transaction.transaction_date, transaction.amount)
+
+
+def apply(rows, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) transactions from every daily rollup.
+
+    Rows are grouped first, so a batch costs one UPDATE per distinct user and
+    day plus a single INSERT into SpendDelta. Call inside the same atomic
+    block as the transaction writes so rollups never drift.
+    """
+    users = defaultdict(lambda: [Decimal('0'), 0])
+    merchants = defaultdict(lambda: [Decimal('0'), 0])
+    for (user_id, merchant_id, category_id), day, amount in rows:
+        for entry in (users[(user_id, day)], merchants[(merchant_id, category_id, day)]):
+            entry[0] += amount * sign
+            entry[1] += sign
+
+    # Sorted, so concurrent batches lock user rows in the same order.
+    for (user_id, day), (total, count) in sorted(users.items()):
+        _increment(UserDailySpend, 'user_id', user_id, day, total, count)
+    SpendDelta.objects.bulk_create([
+        SpendDelta(merchant_id=merchant_id, category_id=category_id, date=day, total=total, count=count)
+        for (merchant_id, category_id, day), (total, count) in merchants.items()
+    ])
+
+
+def _increment(model, field, key, day, total, count):
+    lookup = {field: key, 'date': day}
+    if model.objects.filter(**lookup).update(total=F('total') + total, count=F('count') + count):
+        return
+    try:
+        with db_transaction.atomic():
+            model.objects.create(total=total, count=count, **lookup)
+    except IntegrityError:
+        # Another writer created the row between our UPDATE and INSERT.
+        model.objects.filter(**lookup).update(total=F('total') + total, count=F('count') + count)
+
+
+def fold(batch_size=10000):
+    """
+    Move up to batch_size SpendDelta rows into the merchant and category rollups. Returns how many.
+
+    Folders skip rows another folder has locked, so several can run at once
+    without counting a delta twice, and never block payments.
+    """
+    with db_transaction.atomic():
+        ids = list(SpendDelta.objects.select_for_update(skip_locked=True).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        deltas = SpendDelta.objects.filter(pk__in=ids)
+        for model, field in DIMENSIONS[1:]:
+            groups = deltas.values(field, 'date').annotate(sum_total=Sum('total'), sum_count=Sum('count'))
+            for group in sorted(groups, key=lambda group: (group[field], group['date'])):
+                _increment(model, field, group[field], group['date'], group['sum_total'], group['sum_count'])
+        deltas.delete()
+        return len(ids)
+
+
+def spend(model, field, key, date_from=None, date_to=None):
+    """
+    Return per-day rows and the totals for one key, read from the rollup and its unfolded deltas.
+    """
+    dates = {}
+    if date_from:
+        dates['date__gte'] = date_from
+    if date_to:
+        dates['date__lte'] = date_to
+    by_day = {row['date']: row for row in model.objects.filter(**{field: key}, **dates).values('date', 'total', 'count')}
+    if model in JOURNALLED:
+        for row in (SpendDelta.objects.filter(**{field: key}, **dates).values('date')
+                    .annotate(sum_total=Sum('total'), sum_count=Sum('count'))):
+            day = by_day.setdefault(row['date'], {'date': row['date'], 'total': Decimal('0'), 'count': 0})
+            day['total'] += row['sum_total']
+            day['count'] += row['sum_count']
+    days = [by_day[date] for date in sorted(by_day)]
+    return {
+        'total': sum((day['total'] for day in days), Decimal('0')),
+        'count': sum(day['count'] for day in days),
+        'days': days,
+    }
+
+
+def as_json(spend):
+    """
+    spend() with amounts as two-place strings, the way the serializers render money.
+    """
+    return {
+        'total': money(spend['total']),
+        'count': spend['count'],
+        'days': [{'date': day['date'], 'total': money(day['total']), 'count': day['count']} for day in spend['days']],
+    }
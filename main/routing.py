@@ -0,0 +1,104 @@
+from django.conf import settings
+
+from . import ledger
+from .models import Card
+
+
+POLICIES = ('highest_balance', 'card_type', 'first')
+CARD_TYPES = [value for value, _ in Card._meta.get_field('card_type').choices]
+
+
+class RoutingError(Exception):
+    pass
+
+
+class Route:
+    """
+    The cards funding one payment, as [(card, amount)] legs in debit order.
+    """
+
+    def __init__(self, legs):
+        self.legs = legs
+
+    @property
+    def card(self):
+        return self.legs[0][0]
+
+    def debits(self):
+        return [(card.pk, amount) for card, amount in self.legs]
+
+
+def user_cards(request):
+    """
+    Return request.user's cards annotated with current_balance.
+
+    One query on the card user index, cached on the request so validation,
+    fraud checks and the debit all share the same fetch.
+    """
+    cards = getattr(request, '_user_cards', None)
+    if cards is None:
+        cards = request._user_cards = list(ledger.with_balance(Card.objects.filter(user=request.user)).order_by('id'))
+    return cards
+
+
+def _ordered(cards, policy, card_type):
+    if policy == 'highest_balance':
+        return sorted(cards, key=lambda card: (-card.current_balance, card.pk))
+    if policy == 'card_type':
+        return sorted((card for card in cards if card.card_type == card_type),
+                      key=lambda card: (-card.current_balance, card.pk))
+    return list(cards)
+
+
+def choose(cards, amount, policy=None, card_id=None, card_type=None, split=False):
+    """
+    Pick the card(s) that fund amount and return a Route.
+
+    card_id names a preferred card; otherwise policy orders the candidates.
+    With split, the amount is spread over as many cards as it takes, in
+    that order. Raises RoutingError with a message fit for the client.
+    """
+    policy = policy or getattr(settings, 'CARD_ROUTING_POLICY', 'highest_balance')
+    if policy not in POLICIES:
+        raise RoutingError(f'card_policy must be one of {", ".join(POLICIES)}.')
+    if policy == 'card_type' and card_type not in CARD_TYPES:
+        raise RoutingError(f'card_type must be one of {", ".join(CARD_TYPES)}.')
+    if not cards:
+        raise RoutingError('No card on file.')
+
+    ordered = _ordered(cards, policy, card_type)
+    if card_id is not None:
+        preferred = next((card for card in cards if str(card.pk) == str(card_id)), None)
+        if preferred is None:
+            raise RoutingError('Card not found.')
+        ordered = [preferred] + [card for card in ordered if card.pk != preferred.pk]
+        if not split:
+            ordered = [preferred]
+    if not ordered:
+        raise RoutingError(f'No {card_type} card on file.')
+
+    if not split:
+        card = ordered[0]
+        if card.current_balance < amount:
+            raise RoutingError('Insufficient funds.')
+        return Route([(card, amount)])
+
+    legs = []
+    remaining = amount
+    for card in ordered:
+        if card.current_balance <= 0:
+            continue
+        take = min(card.current_balance, remaining)
+        legs.append((card, take))
+        remaining -= take
+        if not remaining:
+            return Route(legs)
+    raise RoutingError('Insufficient funds.')
+
+
+def choose_for(cards, amount, data):
+    """
+    choose() with the card_policy, card_id, card_type and split fields of a payment request body.
+    """
+    return choose(cards, amount, policy=data.get('card_policy'), card_id=data.get('card_id'),
+                  card_type=data.get('card_type'), split=data.get('split') in (True, 'true', '1', 1))
@@ -0,0 +1,100 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import Card, Merchant, MerchantCategory, Transaction, User
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+@contextmanager
+def explicit_transaction_dates():
+    """
+    Let bulk_create keep the transaction_date we set instead of stamping now().
+    """
+    field = Transaction._meta.get_field('transaction_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def seed(users=1000, cards_per_user=2, categories=20, merchants=200, transactions=100000,
+         days=365, batch_size=5000, prefix='seed', random_seed=0):
+    """
+    Bulk-insert a realistic, reproducible data set and return the created counts.
+
+    Every object is streamed from a generator into bulk_create in batch_size
+    chunks, so memory stays flat however large the volumes are.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(prefix)
+    now = timezone.now()
+
+    def bulk(model, rows):
+        created = []
+        for chunk in _chunks(rows, batch_size):
+            created.extend(model.objects.bulk_create(chunk))
+        return created
+
+    with db_transaction.atomic():
+        user_rows = bulk(User, (
+            User(username=f'{prefix}-user-{i}', phone_number=f'+998{i:09d}', password=password)
+            for i in range(users)
+        ))
+        card_rows = bulk(Card, (
+            Card(user=user, card_number=f'8600{user.id:08d}{n:04d}', card_type=rng.choice(['HUMO', 'UzCard']),
+                 bank_name=rng.choice(['Kapitalbank', 'Hamkorbank', 'Ipak Yuli']),
+                 balance=Decimal(rng.randrange(100000, 100000000)) / 100)
+            for user in user_rows for n in range(cards_per_user)
+        ))
+        category_rows = bulk(MerchantCategory, (
+            MerchantCategory(name=f'{prefix}-category-{i}', description='')
+            for i in range(categories)
+        ))
+        merchant_rows = bulk(Merchant, (
+            Merchant(name=f'{prefix}-merchant-{i}', phone_number=f'+998{i:09d}', category=rng.choice(category_rows))
+            for i in range(merchants)
+        ))
+
+    transaction_count = 0
+    with explicit_transaction_dates():
+        rows = (
+            Transaction(
+                user=rng.choice(user_rows),
+                merchant=rng.choice(merchant_rows),
+                amount=Decimal(rng.randrange(1000, 5000000)) / 100,
+                phone_number=f'+998{rng.randrange(10 ** 9):09d}',
+                transaction_date=now - timedelta(seconds=rng.randrange(days * 86400)),
+                device_id=f'device-{rng.randrange(users * 2)}',
+                ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            )
+            for _ in range(transactions)
+        )
+        for chunk in _chunks(rows, batch_size):
+            with db_transaction.atomic():
+                Transaction.objects.bulk_create(chunk)
+                rollups.apply(rollups.row_for(row, row.merchant.category_id) for row in chunk)
+            transaction_count += len(chunk)
+    while rollups.fold():
+        pass
+
+    return {
+        'users': len(user_rows),
+        'cards': len(card_rows),
+        'categories': len(category_rows),
+        'merchants': len(merchant_rows),
+        'transactions': transaction_count,
+    }
@@ -1,29 +1,126 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import User, Card, Merchant, MerchantCategory, Transaction
+from . import ledger
+from .models import User, Card, Merchant, MerchantCategory, Transaction, Refund
+
+class SparseFieldsMixin:
+    """
+    Takes fields= (names to keep; all when None) and expand= (relations to
+    nest in full, kept whether or not fields names them) keyword arguments.
+    expandable maps a name to a function returning the nested serializer;
+    unknown names raise ValueError.
+    """
+    expandable = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            if name not in self.expandable:
+                raise ValueError(f'Cannot expand {name}.')
+            self.fields[name] = self.expandable[name]()
+        if fields is not None:
+            unknown = [name for name in fields if name not in self.fields]
+            if unknown:
+                raise ValueError(f'Unknown field(s): {", ".join(unknown)}.')
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+    @classmethod
+    def related(cls, name):
+        """
+        The select_related path (a str) or Prefetch that loads expansion name.
+        """
+        return name
+
+    @classmethod
+    def optimize(cls, queryset, fields=None, expand=()):
+        """
+        Defer the columns the selected fields don't read and load expansions in the same round trip.
+        """
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        names = set(cls.Meta.fields if fields is None else fields) | set(expand)
+        queryset = queryset.only('pk', *sorted(name for name in names if name in concrete))
+        for name in expand:
+            lookup = cls.related(name)
+            if isinstance(lookup, str):
+                queryset = queryset.select_related(lookup)
+            else:
+                queryset = queryset.prefetch_related(lookup)
+        return queryset
+
+class RelatedUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'phone_number']
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable = {'cards': lambda: CardSerializer(source='card_set', many=True, read_only=True)}
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'phone_number']
 
-class CardSerializer(serializers.ModelSerializer):
+    @classmethod
+    def related(cls, name):
+        return Prefetch('card_set', queryset=ledger.with_balance(Card.objects.order_by('id')))
+
+class CardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable = {'user': lambda: RelatedUserSerializer(read_only=True)}
+
     class Meta:
         model = Card
         fields = ['id', 'user', 'card_number', 'card_type', 'bank_name', 'balance']
 
-class MerchantCategorySerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        # balance on the model is the last ledger snapshot; show the live figure.
+        data = super().to_representation(instance)
+        if 'balance' not in self.fields:
+            return data
+        current = getattr(instance, 'current_balance', None)
+        if current is None:
+            current = ledger.balance(instance.pk)
+        data['balance'] = self.fields['balance'].to_representation(current)
+        return data
+
+    def update(self, instance, validated_data):
+        balance = validated_data.pop('balance', None)
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        # Card.balance is the snapshot compact() rewrites under its own lock;
+        # saving it here would put back the copy read with instance.
+        instance.save(update_fields=[field.name for field in Card._meta.concrete_fields
+                                     if not field.primary_key and field.name != 'balance'])
+        if balance is not None:
+            ledger.adjust(instance.pk, balance)
+        return instance
+
+class MerchantCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MerchantCategory
         fields = ['id', 'name', 'description']
 
-class MerchantSerializer(serializers.ModelSerializer):
+class MerchantSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = MerchantCategorySerializer()
 
     class Meta:
         model = Merchant
         fields = ['id', 'name', 'phone_number', 'category']
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable = {
+        'user': lambda: RelatedUserSerializer(read_only=True),
+        'merchant': lambda: MerchantSerializer(read_only=True),
+    }
+
+    @classmethod
+    def related(cls, name):
+        return 'merchant__category' if name == 'merchant' else name
+
     class Meta:
         model = Transaction
         fields = ['id', 'user', 'merchant', 'amount', 'phone_number', 'transaction_date', 'device_id', 'ip_address']
+
+class RefundSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Refund
+        fields = ['id', 'transaction_id', 'user', 'merchant', 'card', 'amount', 'transaction_date', 'reason', 'created_at']
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user
+from .catalog import CATEGORIES, MERCHANTS, catalog
+from .models import Merchant, MerchantCategory, User
+
+
+@receiver([post_save, post_delete], sender=Merchant)
+def invalidate_merchant(sender, instance, **kwargs):
+    catalog.invalidate(MERCHANTS, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=MerchantCategory)
+def invalidate_merchant_category(sender, instance, **kwargs):
+    # Cached merchants embed their category, so they go stale with it.
+    catalog.invalidate(CATEGORIES, [instance.pk])
+    catalog.invalidate(MERCHANTS, Merchant.objects.filter(category_id=instance.pk).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
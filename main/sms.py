@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class SMSQueueFull(Exception):
+    pass
+
+
+class TransportError(Exception):
+    """
+    A failed send. permanent means retrying the same message cannot succeed.
+    """
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class TwilioTransport:
+    """
+    Sends messages through the Twilio REST API on one pooled aiohttp session.
+    """
+
+    url = 'https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json'
+
+    def __init__(self):
+        self.session = None
+
+    async def start(self):
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            connector=aiohttp.TCPConnector(limit=getattr(settings, 'SMS_WORKERS', 8)),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+
+    async def send(self, to, body):
+        data = {'To': to, 'From': settings.TWILIO_PHONE_NUMBER, 'Body': body}
+        async with self.session.post(self.url.format(sid=settings.TWILIO_ACCOUNT_SID), data=data) as response:
+            payload = await response.json(content_type=None)
+            if response.status >= 400:
+                # Other 4xx answers (bad number, unsubscribed, auth) will not change on retry.
+                raise TransportError(f'Twilio returned {response.status}: {payload}',
+                                     permanent=response.status < 500 and response.status not in (408, 429))
+            return payload.get('sid')
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class InMemoryTransport:
+    """
+    Records messages instead of sending them. fail_times makes the first N sends raise,
+    with a permanent TransportError when permanent is set.
+    """
+
+    def __init__(self, fail_times=0, permanent=False):
+        self.sent = []
+        self.attempts = 0
+        self.fail_times = fail_times
+        self.permanent = permanent
+
+    async def start(self):
+        pass
+
+    async def send(self, to, body):
+        self.attempts += 1
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise TransportError('Simulated failure.', permanent=self.permanent)
+        self.sent.append((to, body))
+        return f'SM{len(self.sent):032d}'
+
+    async def close(self):
+        pass
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SMSDispatcher:
+    """
+    Bounded SMS queue drained by async workers on a background event loop.
+
+    enqueue() is safe to call from request threads and never waits on the
+    network; it raises SMSQueueFull once queue_size messages are pending.
+    """
+
+    def __init__(self, transport, queue_size=10000, workers=8, rate_per_second=50,
+                 batch_size=20, max_attempts=5, backoff=0.5, start_timeout=10):
+        self.transport = transport
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.rate_per_second = rate_per_second
+        self.start_timeout = start_timeout
+        self.sent = 0
+        self.failed = 0
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._started = threading.Event()
+        self._start_error = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the loop thread if it is not running and wait for the transport.
+
+        Raises whatever transport.start() raised, or TransportError if it
+        takes longer than start_timeout seconds; the next call tries again.
+        """
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sms-dispatcher', daemon=True)
+                self._thread.start()
+            if not self._started.wait(self.start_timeout):
+                raise TransportError(f'SMS transport did not start within {self.start_timeout}s.')
+            if self._start_error is not None:
+                error, self._start_error = self._start_error, None
+                self._thread.join()
+                self._thread = None
+                self._started.clear()
+                raise error
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._main())
+
+    async def _main(self):
+        self._queue = asyncio.Queue()
+        self._bucket = TokenBucket(self.rate_per_second)
+        try:
+            await self.transport.start()
+        except Exception as e:
+            self._start_error = e
+            self._started.set()
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._started.set()
+        try:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            await self.transport.close()
+
+    def enqueue(self, to, body):
+        if not self._slots.acquire(blocking=False):
+            raise SMSQueueFull('SMS queue is full.')
+        try:
+            self.start()
+        except Exception:
+            self._slots.release()
+            raise
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (to, body))
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for _ in batch:
+                self._slots.release()
+            try:
+                await asyncio.gather(*(self._deliver(to, body) for to, body in batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _deliver(self, to, body):
+        for attempt in range(1, self.max_attempts + 1):
+            await self._bucket.acquire()
+            try:
+                await self.transport.send(to, body)
+                self.sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_attempts or getattr(e, 'permanent', False):
+                    self.failed += 1
+                    logger.exception('Giving up on SMS to %s after %d attempts', to, attempt)
+                    return
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stop(self, timeout=None):
+        """
+        Let workers drain what is already queued, then shut the loop down.
+        """
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result(timeout)
+        self._thread.join(timeout)
+        self._thread = None
+        self._started.clear()
+
+    async def _drain(self):
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Return the process-wide dispatcher built from the SMS_* settings.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            transport = import_string(getattr(settings, 'SMS_TRANSPORT', 'main.sms.TwilioTransport'))()
+            _dispatcher = SMSDispatcher(
+                transport,
+                queue_size=getattr(settings, 'SMS_QUEUE_SIZE', 10000),
+                workers=getattr(settings, 'SMS_WORKERS', 8),
+                rate_per_second=getattr(settings, 'SMS_RATE_PER_SECOND', 50),
+                batch_size=getattr(settings, 'SMS_BATCH_SIZE', 20),
+                max_attempts=getattr(settings, 'SMS_MAX_ATTEMPTS', 5),
+            )
+        return _dispatcher
@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import rollups
+from .fast_serializers import FastSerializer, datetime_field, decimal_field, render
+from .models import ArchivedTransaction, CategoryDailySpend, MerchantDailySpend, Refund, Transaction
+
+
+# Merchant statements: totals come from the daily rollups and one aggregate
+# over refunds, never from the transactions themselves; line items are
+# streamed from the (merchant, transaction_date, id) index, archive first,
+# so a statement of any length is built in bounded memory.
+
+LINE = FastSerializer([
+    ('id', 'id'),
+    ('transaction_date', 'transaction_date', datetime_field),
+    ('amount', 'amount', decimal_field(2)),
+    ('user', 'user_id'),
+    ('phone_number', 'phone_number'),
+    ('device_id', 'device_id'),
+    ('refunded', 'refunded'),
+])
+
+share = decimal_field(4)
+
+
+def bounds(date_from, date_to):
+    """
+    Aware datetimes covering the local days date_from..date_to inclusive, as the rollups count them.
+    """
+    return (timezone.make_aware(datetime.combine(date_from, time.min)),
+            timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+
+
+def summary(merchant, date_from, date_to):
+    """
+    Totals, daily breakdown and the merchant's share of its category for the period.
+
+    Rollups are net of refunds, so gross takings are net plus the refunds of
+    transactions made in the period.
+    """
+    start, end = bounds(date_from, date_to)
+    sales = rollups.spend(MerchantDailySpend, 'merchant_id', merchant.pk, date_from, date_to)
+    category = rollups.spend(CategoryDailySpend, 'category_id', merchant.category_id, date_from, date_to)
+    refunds = Refund.objects.filter(merchant=merchant, transaction_date__gte=start, transaction_date__lt=end) \
+        .aggregate(total=Sum('amount'), count=Count('id'))
+    refunded = refunds['total'] or Decimal('0')
+    sales_json = rollups.as_json(sales)
+
+    return {
+        'merchant': {'id': merchant.pk, 'name': merchant.name},
+        'period': {'date_from': date_from, 'date_to': date_to},
+        'totals': {
+            'gross': rollups.money(sales['total'] + refunded),
+            'refunds': rollups.money(refunded),
+            'net': sales_json['total'],
+            'count': sales['count'] + refunds['count'],
+            'refund_count': refunds['count'],
+        },
+        'category': {
+            'id': merchant.category_id,
+            'name': merchant.category.name,
+            'total': rollups.money(category['total']),
+            'count': category['count'],
+            'merchant_share': share(sales['total'] / category['total']) if category['total'] else None,
+        },
+        'days': sales_json['days'],
+    }
+
+
+def _lines(model, merchant_id, start, end):
+    queryset = (model.objects.filter(merchant_id=merchant_id, transaction_date__gte=start, transaction_date__lt=end)
+                .annotate(refunded=Exists(Refund.objects.filter(transaction_id=OuterRef('pk'))))
+                .order_by('transaction_date', 'id'))
+    return LINE.rows(queryset)
+
+
+def iter_ndjson(merchant, date_from, date_to, chunk_size=2000):
+    """
+    Yield the statement as NDJSON bytes: the summary on the first line, then one line per transaction.
+    """
+    yield JSONEncoder().encode(summary(merchant, date_from, date_to)).encode() + b'\n'
+    start, end = bounds(date_from, date_to)
+    to_dict = LINE.to_dict
+    for model in (ArchivedTransaction, Transaction):
+        chunk = []
+        for row in _lines(model, merchant.pk, start, end).iterator(chunk_size=chunk_size):
+            chunk.append(render(to_dict(row)))
+            if len(chunk) >= chunk_size:
+                yield b'\n'.join(chunk) + b'\n'
+                chunk = []
+        if chunk:
+            yield b'\n'.join(chunk) + b'\n'
@@ -1,3 +1,584 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import fraud, ledger, partitions, refunds, rollups, throttling, writebehind
+from .catalog import catalog
+from .fields import pan_hash
+from .metrics import Registry, registry
+from .middleware import MetricsMiddleware
+from .models import (ArchivedTransaction, Card, LedgerEntry, Merchant, MerchantCategory, MerchantDailySpend, Refund,
+                     SpendDelta, Transaction, User)
+from .payments import InsufficientFunds, pay
+from .serializers import CardSerializer
+from .sms import InMemoryTransport, SMSDispatcher, TransportError
+from .throttling import BatchTooLarge, MemoryBackend, RateLimited, RateLimiter
+
+
+# The fraud counters and rate limits are per process and would carry over
+# between tests; the tests that exercise them turn them back on.
+@override_settings(FRAUD_CHECKS_ENABLED=False, RATE_LIMITS_ENABLED=False)
+class APITestCase(TestCase):
+    def setUp(self):
+        # The catalogue cache is per process and outlives each test's rollback.
+        catalog.local.clear()
+        catalog._versions.clear()
+        self.user = User.objects.create_user(username='alice', password='x', phone_number='998901234567')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_card(self, user=None, balance='100.00', card_type='HUMO'):
+        user = user or self.user
+        return Card.objects.create(user=user, card_number=f'8600{Card.objects.count():012d}', card_type=card_type,
+                                   bank_name='bank', balance=Decimal(balance))
+
+    def make_merchant(self):
+        category = MerchantCategory.objects.create(name='Food', description='')
+        return Merchant.objects.create(name='Cafe', phone_number='998900000000', category=category)
+
+    def make_payment(self, card, merchant, amount='10.00', debits=None):
+        return pay(card.user, merchant, card, Decimal(amount), '998901234567', 'device', '127.0.0.1', debits=debits)
+
+
+class CatalogTests(APITestCase):
+    def test_create_category_then_list(self):
+        response = self.client.post('/api/merchant-categories/create/',
+                                    {'name': 'Food', 'description': 'Restaurants'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get('/api/merchant-categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([category['name'] for category in response.json()], ['Food'])
+
+    def test_etag_changes_on_save(self):
+        category = MerchantCategory.objects.create(name='Food', description='')
+        etag = self.client.get(f'/api/merchant-categories/{category.pk}/')['ETag']
+        self.assertEqual(self.client.get(f'/api/merchant-categories/{category.pk}/',
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        category.name = 'Groceries'
+        category.save()
+        response = self.client.get(f'/api/merchant-categories/{category.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Groceries')
+
+    def test_save_merchant_then_list(self):
+        category = MerchantCategory.objects.create(name='Food', description='')
+        self.assertEqual(self.client.get('/api/merchants/').json(), [])
+        merchant = Merchant.objects.create(name='Cafe', phone_number='998900000000', category=category)
+        for _ in range(2):  # the second response comes from the rendered-response cache
+            response = self.client.get('/api/merchants/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([row['id'] for row in response.json()], [merchant.pk])
+
+    def test_non_numeric_merchant_id_is_not_found(self):
+        self.make_card()
+        with self.assertRaises(Merchant.DoesNotExist):
+            catalog.get_merchant('abc')
+        with self.assertRaises(MerchantCategory.DoesNotExist):
+            catalog.get_category(None)
+        response = self.client.post('/api/transactions/create/', {'merchant_id': 'abc', 'amount': '1.00',
+                                                                  'phone_number': '998901234567'}, format='json')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Merchant not found.'}))
+
+
+class SparseFieldsTests(APITestCase):
+    def test_expanded_relation_is_selected(self):
+        card = self.make_card()
+        response = self.client.get(f'/api/users/{self.user.pk}/', {'fields': 'username', 'expand': 'cards'})
+        self.assertEqual(list(response.json()), ['username', 'cards'])
+        self.assertEqual([row['id'] for row in response.json()['cards']], [card.pk])
+
+        rows = self.client.get('/api/cards/', {'fields': 'id,balance', 'expand': 'user'}).json()
+        self.assertEqual(list(rows[0]), ['id', 'user', 'balance'])
+        self.assertEqual(rows[0]['user']['username'], 'alice')
+
+    def test_merchant_fields_follow_serializer_order(self):
+        self.make_merchant()
+        rows = self.client.get('/api/merchants/', {'fields': 'name,id'}).json()
+        self.assertEqual(list(rows[0]), ['id', 'name'])
+
+
+class RefundTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.merchant = self.make_merchant()
+        self.card = self.make_card()
+        self.payment = self.make_payment(self.card, self.merchant)
+
+    def test_owner_refunds_to_card(self):
+        response = self.client.post(f'/api/transactions/{self.payment.pk}/refund/', {'reason': 'broken'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ledger.balance(self.card.pk), Decimal('100.00'))
+        self.assertEqual(self.client.post(f'/api/transactions/{self.payment.pk}/refund/').status_code, 409)
+
+    def test_other_users_transaction_is_not_found(self):
+        mallory = User.objects.create_user(username='mallory', password='x', phone_number='998907654321')
+        self.client.force_authenticate(mallory)
+        self.assertEqual(self.client.post(f'/api/transactions/{self.payment.pk}/refund/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/transactions/{self.payment.pk}/delete/').status_code, 404)
+        self.assertFalse(Refund.objects.exists())
+
+        mallory.is_staff = True
+        mallory.save()
+        self.assertEqual(self.client.delete(f'/api/transactions/{self.payment.pk}/delete/').status_code, 204)
+
+    def test_archived_transaction(self):
+        row = Transaction.objects.filter(pk=self.payment.pk).values(
+            'id', 'user_id', 'merchant_id', 'amount', 'phone_number', 'transaction_date', 'device_id', 'ip_address')[0]
+        ArchivedTransaction.objects.create(**row)
+        Transaction.objects.filter(pk=self.payment.pk).delete()
+        self.assertEqual(self.client.post(f'/api/transactions/{self.payment.pk}/refund/').status_code, 201)
+        self.assertEqual(ledger.balance(self.card.pk), Decimal('100.00'))
+
+    def test_legacy_payment_without_card_conflicts(self):
+        legacy = Transaction.objects.create(user=self.user, merchant=self.merchant, amount=Decimal('5.00'),
+                                            phone_number='998901234567', device_id='d', ip_address='127.0.0.1')
+        self.card.delete()
+        self.assertEqual(self.client.post(f'/api/transactions/{legacy.pk}/refund/').status_code, 409)
+        self.assertFalse(Refund.objects.filter(transaction_id=legacy.pk).exists())
+
+
+class DigitsFieldTests(APITestCase):
+    def test_numeric_phone_number(self):
+        merchant = self.make_merchant()
+        self.make_card()
+        response = self.client.post('/api/transactions/create/', {'merchant_id': merchant.pk, 'amount': '1.00',
+                                                                  'phone_number': 998901234567, 'device_id': 'd'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.get().phone_number, '998901234567')
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [
+            {'merchant_id': merchant.pk, 'amount': '1.00', 'phone_number': 998901234567}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_missing_device_id_is_stored_empty(self):
+        merchant = self.make_merchant()
+        self.make_card()
+        response = self.client.post('/api/transactions/create/', {'merchant_id': merchant.pk, 'amount': '1.00',
+                                                                  'phone_number': '998901234567'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.get().device_id, '')
+
+    @override_settings(CARD_HASH_KEY='another-key')
+    def test_card_hash_uses_its_own_key(self):
+        card = self.make_card()
+        self.assertEqual(card.card_number_hash, pan_hash(card.card_number))
+        with override_settings(SECRET_KEY='rotated'):
+            response = self.client.get('/api/cards/lookup/', {'number': card.card_number})
+        self.assertEqual([row['id'] for row in response.json()], [card.pk])
+
+
+class RollupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.merchant = self.make_merchant()
+        self.card = self.make_card()
+
+    def merchant_spend(self):
+        return self.client.get(f'/api/merchants/{self.merchant.pk}/spend/').json()
+
+    def test_spend_before_and_after_fold(self):
+        for amount in ('10.00', '20.50'):
+            self.make_payment(self.card, self.merchant, amount)
+        self.assertFalse(MerchantDailySpend.objects.exists())
+        before = self.merchant_spend()
+        self.assertEqual((before['total'], before['count']), ('30.50', 2))
+        self.assertEqual(before['days'][0]['total'], '30.50')
+
+        self.assertEqual(rollups.fold(), 2)
+        self.assertFalse(SpendDelta.objects.exists())
+        self.assertEqual(self.merchant_spend(), before)
+        self.assertEqual(self.client.get(f'/api/users/{self.user.pk}/spend/').json()['total'], '30.50')
+
+    def test_backfill_rebuilds_live_archived_and_refunded(self):
+        self.make_payment(self.card, self.merchant, '10.00')
+        archived = self.make_payment(self.card, self.merchant, '20.00')
+        refunded = self.make_payment(self.card, self.merchant, '40.00')
+        refunds.refund(refunded.pk)
+        row = Transaction.objects.filter(pk=archived.pk).values(
+            'id', 'user_id', 'merchant_id', 'amount', 'phone_number', 'transaction_date', 'device_id', 'ip_address')[0]
+        ArchivedTransaction.objects.create(**row)
+        Transaction.objects.filter(pk=archived.pk).delete()
+        expected = self.merchant_spend()
+        self.assertEqual((expected['total'], expected['count']), ('30.00', 2))
+
+        for _ in range(2):  # a rebuild, so running it twice does not double-count
+            call_command('backfill_rollups', stdout=io.StringIO())
+        self.assertEqual(self.merchant_spend(), expected)
+
+    def test_statement_includes_archived_rows(self):
+        payment = self.make_payment(self.card, self.merchant, '10.00')
+        day = timezone.localdate(payment.transaction_date)
+        call_command('archive_transactions', before=(day + timedelta(days=1)).isoformat(), stdout=io.StringIO())
+        self.assertEqual((Transaction.objects.count(), ArchivedTransaction.objects.count()), (0, 1))
+        response = self.client.get(f'/api/merchants/{self.merchant.pk}/statement/',
+                                   {'date_from': day.isoformat(), 'date_to': day.isoformat()})
+        summary, *lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(summary['totals']['gross'], '10.00')
+        self.assertEqual([line['id'] for line in lines], [payment.pk])
+
+    def test_statement_amounts_are_strings(self):
+        payment = self.make_payment(self.card, self.merchant, '10.00')
+        refunds.refund(self.make_payment(self.card, self.merchant, '5.00').pk)
+        day = timezone.localdate(payment.transaction_date).isoformat()
+        summary = self.client.get(f'/api/merchants/{self.merchant.pk}/statement/',
+                                  {'date_from': day, 'date_to': day, 'items': '0'}).json()
+        self.assertEqual(summary['totals'], {'gross': '15.00', 'refunds': '5.00', 'net': '10.00',
+                                             'count': 2, 'refund_count': 1})
+        self.assertEqual((summary['category']['total'], summary['category']['merchant_share']), ('10.00', '1.0000'))
+
+
+class BulkPaymentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.merchant = self.make_merchant()
+        self.card = self.make_card()
+
+    def item(self, **extra):
+        return {'merchant_id': self.merchant.pk, 'amount': '1.00', 'phone_number': '998901234567',
+                'device_id': 'd', **extra}
+
+    @override_settings(FRAUD_CHECKS_ENABLED=True)
+    def test_items_are_fraud_scored(self):
+        fraud._engine = None
+        self.addCleanup(setattr, fraud, '_engine', None)
+        card = self.make_card(balance='1000.00')
+        # One request is one velocity event, however many items it holds.
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [self.item()] * 50}, format='json')
+        self.assertEqual(response.json()['created'], 50)
+
+        # The per-item checks still apply: a fourth device and a spike in amount decline that item.
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [
+            self.item(device_id='d1'), self.item(device_id='d2'), self.item(device_id='d3', amount='100.00'),
+        ]}, format='json')
+        results = response.json()['results']
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(results[2]['error'], 'Transaction declined.')
+        self.assertEqual(results[2]['reasons'], ['device_churn', 'amount_spike'])
+        self.assertEqual(ledger.balance(card.pk), Decimal('948.00'))
+
+    def test_idempotency_key_replays(self):
+        body = {'transactions': [self.item()]}
+        first = self.client.post('/api/transactions/bulk/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        second = self.client.post('/api/transactions/bulk/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_idempotency_key_reused_for_another_body(self):
+        self.client.post('/api/transactions/bulk/', {'transactions': [self.item()]}, format='json',
+                         HTTP_IDEMPOTENCY_KEY='k1')
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [self.item(amount='2.00')]},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_idempotency_key_expires_from_creation(self):
+        body = {'transactions': [self.item()]}
+        self.client.post('/api/transactions/bulk/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        with override_settings(IDEMPOTENCY_KEY_TTL=timedelta(0)):
+            self.client.post('/api/transactions/bulk/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_items_are_routed_like_single_payments(self):
+        richer = self.make_card(balance='150.00')
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [
+            self.item(amount='100.00'),
+            self.item(amount='120.00', split=True),
+            self.item(amount='20.00'),
+            self.item(card_policy='card_type', card_type='UzCard'),
+        ]}, format='json')
+        results = response.json()['results']
+        self.assertEqual(results[3]['error'], 'No UzCard card on file.')
+        # 150 -> 50; then 120 is split 100 + 20 (the first card is now the richer one); then 20 from the 30 left.
+        self.assertEqual(ledger.balance(self.card.pk), Decimal('0.00'))
+        self.assertEqual(ledger.balance(richer.pk), Decimal('10.00'))
+
+
+class MetricsMiddlewareTests(APITestCase):
+    def queries_recorded(self):
+        return registry._counters['http_db_queries_total']['unresolved']
+
+    def test_async_request_counts_queries(self):
+        async def view(request):
+            await sync_to_async(User.objects.count)()
+            await sync_to_async(Card.objects.count)()
+            return HttpResponse()
+
+        before = self.queries_recorded()
+        async_to_sync(MetricsMiddleware(view))(RequestFactory().get('/'))
+        self.assertEqual(self.queries_recorded() - before, 2)
+
+    def test_component_counters_have_their_own_labels(self):
+        metrics = Registry()
+        metrics.inc('http_requests_total', 'list_cards')
+        metrics.inc('payments_throttled_total', 'user', label='scope')
+        metrics.inc('payments_shed_total', None)
+        lines = metrics.render().splitlines()
+        self.assertIn('http_requests_total{endpoint="list_cards"} 1.0', lines)
+        self.assertIn('payments_throttled_total{scope="user"} 1.0', lines)
+        self.assertIn('payments_shed_total 1.0', lines)
+
+    def test_sync_request_counts_queries(self):
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+
+        before = self.queries_recorded()
+        MetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.queries_recorded() - before, 1)
+
+
+class BrokenTransport(InMemoryTransport):
+    def __init__(self, start_delay=0):
+        super().__init__()
+        self.start_delay = start_delay
+
+    async def start(self):
+        if self.start_delay:
+            await asyncio.sleep(self.start_delay)
+        raise ConnectionError('no route to host')
+
+
+class SMSDispatcherTests(SimpleTestCase):
+    def dispatch(self, transport, messages=1, **kwargs):
+        dispatcher = SMSDispatcher(transport, backoff=0, **kwargs)
+        for index in range(messages):
+            dispatcher.enqueue(f'99890000000{index}', 'code')
+        dispatcher.stop(timeout=5)
+        return dispatcher
+
+    def test_delivers_queued_messages(self):
+        transport = InMemoryTransport()
+        dispatcher = self.dispatch(transport, messages=3)
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (3, 0))
+        self.assertEqual(sorted(to for to, _ in transport.sent), ['998900000000', '998900000001', '998900000002'])
+
+    def test_retries_transient_failures(self):
+        transport = InMemoryTransport(fail_times=2)
+        dispatcher = self.dispatch(transport, max_attempts=3)
+        self.assertEqual((dispatcher.sent, transport.attempts), (1, 3))
+
+    def test_permanent_failure_is_not_retried(self):
+        transport = InMemoryTransport(fail_times=1, permanent=True)
+        with self.assertLogs('main.sms', 'ERROR'):
+            dispatcher = self.dispatch(transport, max_attempts=5)
+        self.assertEqual((dispatcher.sent, dispatcher.failed, transport.attempts), (0, 1, 1))
+
+    def test_start_error_propagates_and_frees_the_slot(self):
+        dispatcher = SMSDispatcher(BrokenTransport(), queue_size=1)
+        for _ in range(2):  # a leaked slot would make the second call SMSQueueFull
+            with self.assertRaises(ConnectionError):
+                dispatcher.enqueue('998900000000', 'code')
+
+    def test_start_times_out(self):
+        dispatcher = SMSDispatcher(BrokenTransport(start_delay=1), start_timeout=0.05)
+        with self.assertRaises(TransportError):
+            dispatcher.start()
+
+
+class WriteBehindTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = writebehind.DurableQueue(os.path.join(directory.name, 'queue.sqlite3'))
+        self.merchant = self.make_merchant()
+        self.card = self.make_card()
+
+    def payload(self, transaction_id):
+        return {'id': transaction_id, 'user_id': self.user.pk, 'merchant_id': self.merchant.pk, 'amount': '1.00',
+                'phone_number': '998901234567', 'transaction_date': timezone.now().isoformat(), 'device_id': 'd',
+                'ip_address': '127.0.0.1'}
+
+    def test_unreserved_rows_do_not_block_the_queue(self):
+        self.queue.put(self.payload(10 ** 9))  # its reservation has not committed
+        ledger.debit(self.card.pk, Decimal('1.00'), self.merchant.pk, 10 ** 9 + 1)
+        self.queue.put(self.payload(10 ** 9 + 1))
+
+        writer = writebehind.Writer(self.queue, batch_size=1)
+        self.assertEqual(writer.drain(), 1)
+        self.assertTrue(Transaction.objects.filter(pk=10 ** 9 + 1).exists())
+        self.assertEqual([payload['id'] for _, payload, _ in self.queue.peek(10)], [10 ** 9])
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(MemoryBackend(), {'user': (1, 2), 'ip': (1, 5), 'merchant': (1, 1),
+                                                     'bulk_items': (1, 5)})
+
+    def test_refused_request_charges_no_scope(self):
+        self.limiter.check(1, merchants=['m'], now=0)
+        with self.assertRaises(RateLimited) as raised:
+            self.limiter.check(1, merchants=['m'], now=0)
+        self.assertEqual(raised.exception.scope, 'merchant')
+        self.limiter.check(1, now=0)  # the refused request left the user's second token alone
+
+    def test_bulk_items_are_charged_per_item(self):
+        self.limiter.check(1, merchants=['m', 'm'], items=3, now=0)
+        with self.assertRaises(RateLimited) as raised:
+            self.limiter.check(1, items=3, now=0)
+        self.assertEqual(raised.exception.scope, 'bulk_items')
+        with self.assertRaises(BatchTooLarge):
+            self.limiter.check(2, items=6, now=0)
+
+
+@override_settings(RATE_LIMITS_ENABLED=True, RATE_LIMITS={})
+class DefaultRateLimitTests(APITestCase):
+    def test_realistic_batch_fits_the_default_limits(self):
+        throttling._limiter = None
+        self.addCleanup(setattr, throttling, '_limiter', None)
+        merchant = self.make_merchant()
+        self.make_card(balance='10000.00')
+        item = {'merchant_id': merchant.pk, 'amount': '1.00', 'phone_number': '998901234567', 'device_id': 'd'}
+        for _ in range(2):
+            response = self.client.post('/api/transactions/bulk/', {'transactions': [item] * 500}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['created'], 500)
+
+
+class LedgerTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.merchant = self.make_merchant()
+        self.card = self.make_card(balance='100.00')
+        self.other = self.make_card(balance='50.00')
+
+    def test_split_payment_is_atomic(self):
+        with self.assertRaises(InsufficientFunds):
+            self.make_payment(self.card, self.merchant, '120.00', debits=[(self.card.pk, Decimal('60.00')),
+                                                                          (self.other.pk, Decimal('60.00'))])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(LedgerEntry.objects.exists())
+        self.assertEqual(ledger.balances([self.card.pk, self.other.pk]),
+                         {self.card.pk: Decimal('100.00'), self.other.pk: Decimal('50.00')})
+
+    def test_refund_of_split_payment_credits_each_card(self):
+        payment = self.make_payment(self.card, self.merchant, '100.00', debits=[(self.card.pk, Decimal('70.00')),
+                                                                                (self.other.pk, Decimal('30.00'))])
+        refunds.refund(payment.pk)
+        self.assertEqual(ledger.balances([self.card.pk, self.other.pk]),
+                         {self.card.pk: Decimal('100.00'), self.other.pk: Decimal('50.00')})
+        self.assertEqual(ledger.unbalanced_postings(), [])
+
+    def test_balance_survives_compaction(self):
+        self.make_payment(self.card, self.merchant, '10.00')
+        refunds.refund(self.make_payment(self.card, self.merchant, '5.00').pk)
+        ledger.credit(self.other.pk, Decimal('25.00'))
+        before = ledger.balances([self.card.pk, self.other.pk])
+
+        # The pending cards, then lock, read, snapshot, entries and cards, with a savepoint around them.
+        with self.assertNumQueries(8):
+            self.assertEqual(ledger.compact(), 2)
+        self.assertEqual(ledger.balances([self.card.pk, self.other.pk]), before)
+        self.assertEqual(dict(Card.objects.values_list('pk', 'balance')), before)
+        self.assertFalse(LedgerEntry.objects.filter(card__isnull=False, snapshot__isnull=True).exists())
+
+        self.make_payment(self.card, self.merchant, '1.00')
+        self.assertEqual(ledger.balance(self.card.pk), before[self.card.pk] - 1)
+
+    def test_card_update_keeps_a_snapshot_compacted_meanwhile(self):
+        stale = Card.objects.get(pk=self.card.pk)
+        self.make_payment(self.card, self.merchant, '10.00')
+        ledger.compact()
+        serializer = CardSerializer(stale, data={'bank_name': 'Other bank'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(Card.objects.get(pk=self.card.pk).bank_name, 'Other bank')
+        self.assertEqual(ledger.balance(self.card.pk), Decimal('90.00'))
+
+
+class ConcurrentDebitTests(TransactionTestCase):
+    def test_concurrent_debits_never_overdraw(self):
+        user = User.objects.create_user(username='alice', password='x', phone_number='998901234567')
+        card = Card.objects.create(user=user, card_number='8600000000000001', card_type='HUMO', bank_name='bank',
+                                   balance=Decimal('100.00'))
+        category = MerchantCategory.objects.create(name='Food', description='')
+        merchant = Merchant.objects.create(name='Cafe', phone_number='998900000000', category=category)
+        barrier = threading.Barrier(5)
+        outcomes = []
+
+        def attempt():
+            barrier.wait()
+            try:
+                pay(user, merchant, card, Decimal('30.00'), '998901234567', 'device', '127.0.0.1')
+                outcomes.append('paid')
+            except InsufficientFunds:
+                outcomes.append('declined')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['declined', 'declined', 'paid', 'paid', 'paid'])
+        self.assertEqual(ledger.balance(card.pk), Decimal('10.00'))
+
+
+class PartitionTests(APITestCase):
+    def test_convert_keeps_rows_and_routes_new_months(self):
+        merchant = self.make_merchant()
+        card = self.make_card()
+        payments = [self.make_payment(card, merchant) for _ in range(3)]
+        with connection.cursor() as cursor:
+            # Run the deferred FK checks of the inserts above, or PostgreSQL refuses the ALTER TABLE.
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        call_command('partition_transactions', months_ahead=2, stdout=io.StringIO())
+
+        call_command('partition_transactions', months_ahead=2, stdout=io.StringIO())  # now only tops up months
+
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(Transaction.objects.count(), 3)
+        later = self.make_payment(card, merchant)
+        self.assertGreater(later.pk, payments[-1].pk)
+        month = partitions.next_month(timezone.localdate(later.transaction_date))
+        Transaction.objects.filter(pk=later.pk).update(
+            transaction_date=timezone.make_aware(datetime.combine(month, datetime.min.time())))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {partitions.table()} WHERE id = %s', [later.pk])
+            self.assertEqual(cursor.fetchone()[0], partitions.partition_name(month))
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {partitions.table()} WHERE id = %s',
+                           [payments[0].pk])
+            self.assertEqual(cursor.fetchone()[0], f'{partitions.table()}_legacy')
+
+
+class AsyncPaymentConnectionTests(TransactionTestCase):
+    def other_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM pg_stat_activity '
+                           'WHERE datname = current_database() AND pid <> pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    @override_settings(FRAUD_CHECKS_ENABLED=False, RATE_LIMITS_ENABLED=False)
+    def test_worker_connection_is_closed(self):
+        user = User.objects.create_user(username='alice', password='x', phone_number='998901234567')
+        Card.objects.create(user=user, card_number='8600000000000001', card_type='HUMO', bank_name='bank',
+                            balance=Decimal('100.00'))
+        category = MerchantCategory.objects.create(name='Food', description='')
+        merchant = Merchant.objects.create(name='Cafe', phone_number='998900000000', category=category)
+        before = self.other_connections()
+
+        response = async_to_sync(self.async_client.post)(
+            '/api/async/transactions/create/',
+            {'merchant_id': merchant.pk, 'amount': '1.00', 'phone_number': '998901234567', 'device_id': 'd'},
+            content_type='application/json', headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'})
+        self.assertEqual(response.status_code, 201)
+        deadline = time.monotonic() + 2  # the server side of a closed connection goes away asynchronously
+        while self.other_connections() > before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.other_connections(), before)
@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import registry
+from .payments import MAX_BATCH_SIZE
+
+
+# Payment admission, in two layers. Token buckets per user, IP and merchant
+# answer 429 to a client sending faster than its share; the admission
+# controller answers 503 once this process has PAYMENT_MAX_IN_FLIGHT payments
+# running, so overload queues at the client instead of on database connections.
+
+# scope: (tokens per second, burst). Every request costs one token from its
+# user, IP and merchant buckets whatever its size. A bulk request also takes
+# one token per item from the user's bulk_items bucket, whose burst is the
+# largest batch accepted; a bigger one could never be granted and is refused.
+DEFAULT_LIMITS = {
+    'user': (5, 20),
+    'ip': (20, 100),
+    'merchant': (200, 1000),
+    'bulk_items': (100, MAX_BATCH_SIZE),
+}
+
+
+def _take_all(states, buckets, now):
+    """
+    Refill each bucket from its (tokens, updated) state and take every cost, or none when one falls short.
+    Returns the new states and each bucket's wait in seconds (all 0 when granted).
+    """
+    levels = [min(burst, tokens + (now - updated) * rate)
+              for (tokens, updated), (_, rate, burst, _) in zip(states, buckets)]
+    waits = [0 if level >= cost else (cost - level) / rate
+             for level, (_, rate, _, cost) in zip(levels, buckets)]
+    granted = not any(waits)
+    states = [(level - cost if granted else level, now) for level, (_, _, _, cost) in zip(levels, buckets)]
+    return states, waits
+
+
+class MemoryBackend:
+    """
+    Per-process token buckets. Keys idle the longest are dropped once more than max_keys are tracked.
+    """
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or getattr(settings, 'RATE_LIMIT_MAX_KEYS', 200000)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_all(self, buckets, now):
+        """
+        Take cost tokens from every (key, rate, burst, cost) bucket, or from none of them.
+        Returns each bucket's wait: 0 when granted, else the seconds until it would be.
+        """
+        with self._lock:
+            states = [self._buckets.get(key, (burst, now)) for key, _, burst, _ in buckets]
+            states, waits = _take_all(states, buckets, now)
+            for (key, _, _, _), state in zip(buckets, states):
+                self._buckets[key] = state
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return waits
+
+
+class CacheBackend:
+    """
+    Token buckets in the Django cache named by RATE_LIMIT_CACHE_ALIAS, shared between processes.
+
+    Each bucket is one (tokens, updated) entry written back after the check,
+    so concurrent requests for the same key can both pass: the limit is
+    approximate by at most the number of processes.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default')]
+
+    def take_all(self, buckets, now):
+        cache_keys = [f'ratelimit:{key}' for key, _, _, _ in buckets]
+        stored = self.cache.get_many(cache_keys)
+        states = [stored.get(cache_key, (burst, now)) for cache_key, (_, _, burst, _) in zip(cache_keys, buckets)]
+        states, waits = _take_all(states, buckets, now)
+        for cache_key, state, (_, rate, burst, _) in zip(cache_keys, states, buckets):
+            # An untouched bucket refills completely in burst / rate seconds.
+            self.cache.set(cache_key, state, timeout=burst / rate + 1)
+        return waits
+
+
+class RateLimited(Exception):
+    def __init__(self, scope, wait):
+        super().__init__(f'Too many payment requests for this {scope}.')
+        self.scope = scope
+        self.wait = wait
+
+
+class BatchTooLarge(Exception):
+    def __init__(self, scope, burst):
+        super().__init__(f'A request may make at most {burst} payments.')
+        self.scope = scope
+        self.burst = burst
+
+
+class RateLimiter:
+    def __init__(self, backend, limits=None):
+        self.backend = backend
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+
+    def check(self, user_id=None, ip_address=None, merchants=(), items=0, now=None):
+        """
+        Take tokens for one payment request; merchants is an iterable of merchant ids
+        and items the size of a bulk request (0 for a single payment).
+
+        Every scope is checked before any is charged, so a request refused by
+        one scope costs the others nothing. Raises RateLimited naming the
+        first exhausted scope, or BatchTooLarge when items exceeds the bulk_items burst.
+        """
+        now = time.time() if now is None else now
+        charges = [('user', user_id, 1), ('ip', ip_address, 1)]
+        charges += [('merchant', merchant_id, 1) for merchant_id in sorted(set(merchants))]
+        if items:
+            charges.append(('bulk_items', user_id, items))
+        scopes = []
+        buckets = []
+        for scope, key, count in charges:
+            limit = self.limits.get(scope)
+            if key is None or key == '' or limit is None:
+                continue
+            rate, burst = limit
+            if count > burst:
+                raise BatchTooLarge(scope, burst)
+            scopes.append(scope)
+            buckets.append((f'{scope}:{key}', rate, burst, count))
+        if not buckets:
+            return
+        for scope, wait in zip(scopes, self.backend.take_all(buckets, now)):
+            if wait:
+                registry.inc('payments_throttled_total', scope, help_text='Payment requests refused by a rate limit.',
+                             label='scope')
+                raise RateLimited(scope, wait)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    Bounds the payments running at once in this process.
+
+    A request over the limit waits up to queue_timeout seconds for a slot and
+    is then refused, so latency under overload is capped rather than growing
+    with the backlog.
+    """
+
+    def __init__(self, limit, queue_timeout=0.0):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.queue_timeout:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            registry.inc('payments_shed_total', None, help_text='Payment requests refused under overload.')
+            raise Overloaded('Too many payments in progress; retry shortly.')
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+_limiter = None
+_controller = None
+_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    Return the process-wide limiter built from RATE_LIMIT_BACKEND and RATE_LIMITS.
+    """
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            backend = import_string(getattr(settings, 'RATE_LIMIT_BACKEND', 'main.throttling.MemoryBackend'))()
+            _limiter = RateLimiter(backend, getattr(settings, 'RATE_LIMITS', None))
+        return _limiter
+
+
+def get_controller():
+    """
+    Return the process-wide admission controller, or None when PAYMENT_MAX_IN_FLIGHT is unset.
+    A changed limit gets a new controller; payments holding the old one's slots release them there.
+    """
+    global _controller
+    limit = getattr(settings, 'PAYMENT_MAX_IN_FLIGHT', None)
+    if not limit:
+        return None
+    with _lock:
+        if _controller is None or _controller.limit != limit:
+            _controller = AdmissionController(limit, getattr(settings, 'PAYMENT_ADMISSION_TIMEOUT', 0.0))
+        return _controller
+
+
+def in_flight():
+    return _controller.in_flight if _controller is not None else 0
+
+
+def payment_merchants(data):
+    """
+    Merchant ids a payment request body charges: merchant_id, or one per item of a bulk request.
+    """
+    items = data.get('transactions')
+    if isinstance(items, list):
+        return Counter(str(item['merchant_id']) for item in items if isinstance(item, dict) and item.get('merchant_id'))
+    return Counter([str(data['merchant_id'])] if data.get('merchant_id') else [])
+
+
+def check_payment(user_id, ip_address, data):
+    """
+    Apply the rate limits to a payment request body. Raises RateLimited or BatchTooLarge.
+    """
+    if not getattr(settings, 'RATE_LIMITS_ENABLED', True):
+        return
+    items = data.get('transactions')
+    items = len(items) if isinstance(items, list) else 0
+    get_limiter().check(user_id, ip_address, payment_merchants(data), items=items)
+
+
+@contextmanager
+def admit(user_id, ip_address, data):
+    """
+    Check the rate limits, then hold an admission slot for the body of the with block.
+    Raises RateLimited, BatchTooLarge or Overloaded before entering it.
+    """
+    check_payment(user_id, ip_address, data)
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    with controller:
+        yield
+
+
+def payment_admission(view):
+    """
+    Answer 429 (rate limited), 400 (batch over a burst) or 503 (overloaded) instead of running view.
+
+    Put it under @api_view, outside run_once, so a refused request never
+    records its Idempotency-Key and the client's retry runs normally.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            with admit(request.user.pk, request.META.get('REMOTE_ADDR'), request.data):
+                return view(request, *args, **kwargs)
+        except RateLimited as e:
+            return Response({'error': str(e), 'scope': e.scope}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={'Retry-After': str(max(1, round(e.wait)))})
+        except BatchTooLarge as e:
+            return Response({'error': str(e), 'scope': e.scope}, status=status.HTTP_400_BAD_REQUEST)
+        except Overloaded as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': '1'})
+    return wrapped
@@ -5,7 +5,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
-from . import views
+from . import async_views, views
 
 
 
@@ -13,13 +13,16 @@ urlpatterns = [
     # User CRUD
     path('users/', views.list_users, name='list_users'),
     path('users/create/', views.create_user, name='create_user'),
+    path('users/lookup/', views.lookup_users, name='lookup_users'),
     path('users/<int:pk>/', views.get_user, name='get_user'),
     # path('users/<int:pk>/update/', views.update_user, name='update_user'),
     path('users/<int:pk>/delete/', views.delete_user, name='delete_user'),
+    path('users/<int:pk>/spend/', views.get_user_spend, name='get_user_spend'),
 
     # Card CRUD
     path('cards/', views.list_cards, name='list_cards'),
     path('cards/create/', views.create_card, name='create_card'),
+    path('cards/lookup/', views.lookup_cards, name='lookup_cards'),
     path('cards/<int:pk>/', views.get_card, name='get_card'),
     path('cards/<int:pk>/update/', views.update_card, name='update_card'),
     path('cards/<int:pk>/delete/', views.delete_card, name='delete_card'),
@@ -30,6 +33,9 @@ urlpatterns = [
     path('merchants/<int:pk>/', views.get_merchant, name='get_merchant'),
     # path('merchants/<int:pk>/update/', views.update_merchant, name='update_merchant'),
     path('merchants/<int:pk>/delete/', views.delete_merchant, name='delete_merchant'),
+    path('merchants/<int:pk>/spend/', views.get_merchant_spend, name='get_merchant_spend'),
+    path('merchants/<int:pk>/statement/', views.get_merchant_statement, name='get_merchant_statement'),
+    path('merchants/cache-stats/', views.catalog_stats, name='catalog_stats'),
 
      # Merchant Category CRUD
     path('merchant-categories/', views.list_merchant_categories, name='list_merchant_categories'),
@@ -37,12 +43,23 @@ urlpatterns = [
     path('merchant-categories/<int:pk>/', views.get_merchant_category, name='get_merchant_category'),
     path('merchant-categories/<int:pk>/update/', views.update_merchant_category, name='update_merchant_category'),
     path('merchant-categories/<int:pk>/delete/', views.delete_merchant_category, name='delete_merchant_category'),
+    path('merchant-categories/<int:pk>/spend/', views.get_merchant_category_spend, name='get_merchant_category_spend'),
 
     # Transaction CRUD
     path('transactions/', views.list_transactions, name='list_transactions'),
     path('transactions/create/', views.create_transaction_view, name='create_transaction'),
+    path('transactions/bulk/', views.create_transactions_bulk, name='create_transactions_bulk'),
+    path('transactions/export/', views.export_transactions, name='export_transactions'),
+    path('transactions/refund/', views.refund_transactions_bulk, name='refund_transactions_bulk'),
     path('transactions/<int:pk>/', views.get_transaction, name='get_transaction'),
     path('transactions/<int:pk>/delete/', views.delete_transaction, name='delete_transaction'),
+    path('transactions/<int:pk>/refund/', views.refund_transaction, name='refund_transaction'),
+
+    # Async (ASGI-native) hot paths
+    path('async/cards/<int:pk>/', async_views.get_card, name='async_get_card'),
+    path('async/transactions/', async_views.list_transactions, name='async_list_transactions'),
+    path('async/transactions/create/', async_views.create_transaction, name='async_create_transaction'),
+    path('async/transactions/<int:pk>/', async_views.get_transaction, name='async_get_transaction'),
 
     # JWT Authentication
     path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
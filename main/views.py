@@ -1,29 +1,52 @@
+import itertools
+
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import User, Card, Merchant, MerchantCategory, Transaction
-from .serializers import UserSerializer, CardSerializer, MerchantSerializer, MerchantCategorySerializer, TransactionSerializer
-from twilio.rest import Client
-from rest_framework.permissions import IsAuthenticated
+from .models import User, Card, Merchant, MerchantCategory, Transaction, ArchivedTransaction, UserDailySpend, MerchantDailySpend, CategoryDailySpend
+from .serializers import UserSerializer, CardSerializer, MerchantSerializer, MerchantCategorySerializer, TransactionSerializer, RefundSerializer
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import export, fast_serializers, ledger, lookup, refunds, rollups, routing, statements, writebehind
+from .throttling import payment_admission
+from .payments import MAX_BATCH_SIZE, InsufficientFunds, parse_amount, pay, pay_batch
+from .catalog import CATEGORIES, MERCHANTS, catalog, catalog_response
+from .fraud import get_engine
+from .idempotency import run_once
+from .metrics import registry
+from .sms import get_dispatcher
+from .pagination import (MAX_PAGE_SIZE, InvalidCursor, filter_transactions, get_fieldset, get_page_size, iter_ndjson,
+                         keyset_page)
+from .routers import read_from_replica
 
 
 # Helper Functions (same as before)
+def _fast_response(request, data):
+    """
+    Render plain serialized data with the fast JSON encoder when JSON was negotiated.
+    """
+    if request.accepted_renderer.format == 'json':
+        return HttpResponse(fast_serializers.render(data), content_type='application/json')
+    return Response(data)
+
+
+def _bad_request(e):
+    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 def send_sms(phone_number, code):
     """
-    Send SMS verification code using Twilio.
+    Queue an SMS verification code for background delivery.
+
+    Returns immediately; raises SMSQueueFull if the dispatcher is saturated.
     """
-    client = Client('your_twilio_account_sid', 'your_twilio_auth_token')
-    message = client.messages.create(
-        body=f"Your verification code is {code}",
-        from_='your_twilio_phone_number',
-        to=phone_number
-    )
-    return message.sid
+    get_dispatcher().enqueue(phone_number, f"Your verification code is {code}")
 
 
 def validate_transaction_data(request):
     
-    user = request.user
     merchant_id = request.data.get('merchant_id')
     amount = request.data.get('amount')
     phone_number = request.data.get('phone_number')
@@ -31,33 +54,33 @@ def validate_transaction_data(request):
     if not merchant_id or not amount or not phone_number:
         return None, None, {'error': 'Merchant ID, amount, and phone number are required.'}
 
+    amount = parse_amount(amount)
+    if amount is None:
+        return None, None, {'error': 'Amount must be a positive number.'}
+
     try:
-        merchant = Merchant.objects.get(id=merchant_id)
-        card = Card.objects.filter(user=user).first()
-        if card.balance < amount:
-            return None, None, {'error': 'Insufficient funds.'}
-        return merchant, card, None
+        merchant = catalog.get_merchant(merchant_id)
     except Merchant.DoesNotExist:
         return None, None, {'error': 'Merchant not found.'}
 
+    try:
+        route = routing.choose_for(routing.user_cards(request), amount, request.data)
+    except routing.RoutingError as e:
+        return None, None, {'error': str(e)}
+    return merchant, route, None
 
-def create_transaction(user, merchant, card, amount, phone_number, device_id, ip_address):
-    """
-    Create a transaction and deduct balance from the user's card.
+
+def create_transaction(user, merchant, route, amount, phone_number, device_id, ip_address):
     """
-    transaction = Transaction.objects.create(
-        user=user,
-        merchant=merchant,
-        amount=amount,
-        phone_number=phone_number,
-        device_id=device_id,
-        ip_address=ip_address
-    )
-    
-    card.balance -= amount
-    card.save()
+    Create a transaction and deduct balance from the card(s) in route.
 
-    return transaction
+    The debits are posted to the ledger under per-card locks in the same atomic
+    block as the insert, so concurrent payments against one card cannot
+    overdraw and a split payment is all or nothing. Raises InsufficientFunds
+    if a balance dropped below its share meanwhile.
+    """
+    return pay(user, merchant, route.card, parse_amount(amount), phone_number, device_id, ip_address,
+               debits=route.debits())
 
 
 
@@ -75,23 +98,33 @@ def create_user(request):
 
 
 @api_view(['GET'])
+@read_from_replica
 def list_users(request):
     """
-    List all users.
+    List all users. ?fields= and ?expand=cards apply.
     """
-    users = User.objects.all()
-    serializer = UserSerializer(users, many=True)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        serializer = UserSerializer(UserSerializer.optimize(User.objects.all(), fields, expand),
+                                    many=True, fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
     return Response(serializer.data)
 
 
 @api_view(['GET'])
+@read_from_replica
 def get_user(request, pk):
     """
     Get a user by ID.
     """
+    fields, expand = get_fieldset(request.query_params)
     try:
-        user = User.objects.get(pk=pk)
-        serializer = UserSerializer(user)
+        serializer = UserSerializer(fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
+    try:
+        serializer.instance = UserSerializer.optimize(User.objects.all(), fields, expand).get(pk=pk)
         return Response(serializer.data)
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -114,6 +147,24 @@ def get_user(request, pk):
 #         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@read_from_replica
+def lookup_users(request):
+    """
+    Find users by ?phone=, in any formatting.
+    """
+    phone_number = request.query_params.get('phone')
+    if not phone_number:
+        return Response({'error': 'phone is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        serializer = UserSerializer(UserSerializer.optimize(lookup.users_by_phone(phone_number), fields, expand),
+                                    many=True, fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
+    return Response(serializer.data)
+
+
 @api_view(['DELETE'])
 def delete_user(request, pk):
     """
@@ -142,28 +193,59 @@ def create_card(request):
 
 
 @api_view(['GET'])
+@read_from_replica
 def list_cards(request):
     """
-    List all cards.
+    List all cards. ?fields= and ?expand=user apply.
     """
-    cards = Card.objects.all()
-    serializer = CardSerializer(cards, many=True)
-    return Response(serializer.data)
+    try:
+        spec = fast_serializers.CARD.select(*get_fieldset(request.query_params))
+    except ValueError as e:
+        return _bad_request(e)
+    return _fast_response(request, spec.many(spec.rows(ledger.with_balance(Card.objects.order_by('id')))))
 
 
 @api_view(['GET'])
+@read_from_replica
 def get_card(request, pk):
     """
     Get a card by ID.
     """
+    fields, expand = get_fieldset(request.query_params)
     try:
-        card = Card.objects.get(pk=pk)
-        serializer = CardSerializer(card)
+        serializer = CardSerializer(fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
+    try:
+        serializer.instance = CardSerializer.optimize(ledger.with_balance(Card.objects.all()), fields, expand).get(pk=pk)
         return Response(serializer.data)
     except Card.DoesNotExist:
         return Response({'error': 'Card not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@read_from_replica
+def lookup_cards(request):
+    """
+    Find cards by full ?number= or by ?prefix= (BIN or masked PAN).
+    """
+    card_number = request.query_params.get('number')
+    prefix = request.query_params.get('prefix')
+    if card_number:
+        cards = lookup.cards_by_number(card_number)
+    elif prefix:
+        cards = lookup.cards_by_prefix(prefix)[:MAX_PAGE_SIZE]
+    else:
+        return Response({'error': 'number or prefix is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        serializer = CardSerializer(CardSerializer.optimize(ledger.with_balance(cards), fields, expand),
+                                    many=True, fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
+    return Response(serializer.data)
+
+
 @api_view(['PUT'])
 def update_card(request, pk):
     """
@@ -208,24 +290,34 @@ def create_merchant(request):
 
 
 @api_view(['GET'])
+@catalog_response(MERCHANTS)
 def list_merchants(request):
     """
-    List all merchants.
+    List all merchants. ?fields= applies.
     """
-    merchants = Merchant.objects.all()
-    serializer = MerchantSerializer(merchants, many=True)
-    return Response(serializer.data)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        spec = fast_serializers.MERCHANT.select(fields, expand)
+    except ValueError as e:
+        return _bad_request(e)
+    merchants = catalog.list_merchants()
+    if fields is not None:
+        merchants = [{name: merchant[name] for name in spec.names} for merchant in merchants]
+    return _fast_response(request, merchants)
 
 
 @api_view(['GET'])
+@catalog_response(MERCHANTS)
 def get_merchant(request, pk):
     """
     Get a merchant by ID.
     """
     try:
-        merchant = Merchant.objects.get(pk=pk)
-        serializer = MerchantSerializer(merchant)
+        fields, expand = get_fieldset(request.query_params)
+        serializer = MerchantSerializer(catalog.get_merchant(pk), fields=fields, expand=expand)
         return Response(serializer.data)
+    except ValueError as e:
+        return _bad_request(e)
     except Merchant.DoesNotExist:
         return Response({'error': 'Merchant not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -246,10 +338,19 @@ def delete_merchant(request, pk):
 
 
 @api_view(['POST'])
+@payment_admission
 def create_transaction_view(request):
     """
     Create a new transaction.
+
+    Retries carrying the same Idempotency-Key header get the original response
+    back without a second debit. Rate-limited requests get 429 and requests
+    over the in-flight payment limit 503, both with Retry-After.
     """
+    return run_once(request, _create_transaction)
+
+
+def _create_transaction(request):
     user = request.user
     amount = request.data.get('amount')
     phone_number = request.data.get('phone_number')
@@ -257,54 +358,205 @@ def create_transaction_view(request):
     ip_address = request.META.get('REMOTE_ADDR')
 
 
-    merchant, card, error_response = validate_transaction_data(request)
+    merchant, route, error_response = validate_transaction_data(request)
     if error_response:
         return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
 
+    if getattr(settings, 'FRAUD_CHECKS_ENABLED', True):
+        assessment = get_engine().assess(user.pk, route.card.pk, device_id, ip_address, parse_amount(amount))
+        if assessment.blocked:
+            return Response({'error': 'Transaction declined.', 'reasons': assessment.reasons},
+                            status=status.HTTP_403_FORBIDDEN)
 
-    transaction = create_transaction(user, merchant, card, amount, phone_number, device_id, ip_address)
+    try:
+        if writebehind.enabled():
+            transaction_id = writebehind.reserve(user, merchant, route.debits(), parse_amount(amount),
+                                                 phone_number, device_id, ip_address)
+            return Response({'message': 'Transaction accepted.', 'transaction_id': transaction_id},
+                            status=status.HTTP_202_ACCEPTED)
+        transaction = create_transaction(user, merchant, route, amount, phone_number, device_id, ip_address)
+    except InsufficientFunds as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     return Response({'message': 'Transaction successful.', 'transaction_id': transaction.id}, 
                      status=status.HTTP_201_CREATED)
 
 
 
+@api_view(['POST'])
+@payment_admission
+def create_transactions_bulk(request):
+    """
+    Create many transactions in one request.
+
+    Expects {"transactions": [{"merchant_id", "amount", "phone_number", "device_id", "card_id"?}, ...]}
+    and returns one result per item, either a transaction_id or an error.
+    Items are fraud-scored with the request as one velocity event, and an
+    Idempotency-Key replays the whole response.
+    """
+    return run_once(request, _create_transactions_bulk)
+
+
+def _create_transactions_bulk(request):
+    items = request.data.get('transactions')
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'A non-empty transactions list is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > MAX_BATCH_SIZE:
+        return Response({'error': f'At most {MAX_BATCH_SIZE} transactions per request.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    results = pay_batch(request.user, items, request.META.get('REMOTE_ADDR'))
+    created = sum(1 for result in results if 'transaction_id' in result)
+    return Response({'created': created, 'failed': len(results) - created, 'results': results},
+                    status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+
+
 @api_view(['GET'])
+@read_from_replica
 def list_transactions(request):
     """
-    List all transactions.
+    List transactions newest first, one cursor page at a time.
+
+    Filters: user, merchant, phone, date_from, date_to. Pass ?cursor= from the previous
+    page to continue, or ?stream=1 to stream every matching row. Archived rows
+    follow the live ones once those run out. ?fields= and ?expand=user,merchant apply.
     """
-    transactions = Transaction.objects.all()
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        transactions = filter_transactions(Transaction.objects.all(), request.query_params)
+        archived = filter_transactions(ArchivedTransaction.objects.all(), request.query_params)
+        # The cursor is read from transaction_date and id whichever fields are returned.
+        spec = fast_serializers.TRANSACTION.select(fields, expand, extra=('transaction_date', 'id'))
+    except ValueError as e:
+        return _bad_request(e)
+
+    if request.query_params.get('stream') in ('1', 'true'):
+        rows = itertools.chain.from_iterable(
+            iter_ndjson(TransactionSerializer.optimize(queryset.order_by('-transaction_date', '-id'), fields, expand),
+                        TransactionSerializer, fields=fields, expand=expand)
+            for queryset in (transactions, archived)
+        )
+        return StreamingHttpResponse(rows, content_type='application/x-ndjson')
+
+    try:
+        rows, next_cursor = keyset_page(transactions, request.query_params.get('cursor'),
+                                        get_page_size(request.query_params), archived, values=spec.lookups)
+    except InvalidCursor as e:
+        return _bad_request(e)
+    return _fast_response(request, {'next_cursor': next_cursor, 'results': spec.many(rows)})
 
 
 
 @api_view(['GET'])
+def export_transactions(request):
+    """
+    Stream transactions joined with merchant and category as a columnar file.
+
+    ?output=parquet|arrow|csv (parquet/arrow need pyarrow; csv is gzip-compressed)
+    plus the list_transactions filters.
+    """
+    output = request.query_params.get('output') or export.default_format()
+    if output not in export.CONTENT_TYPES:
+        return Response({'error': f'output must be one of {", ".join(export.CONTENT_TYPES)}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if output != 'csv' and not export.pyarrow_available():
+        return Response({'error': f'{output} export needs pyarrow; use output=csv.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filter_transactions(Transaction.objects.all(), request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    content_type, extension = export.CONTENT_TYPES[output]
+    response = StreamingHttpResponse(export.stream(request.query_params.copy(), output), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transactions.{extension}"'
+    return response
+
+
+
+@api_view(['GET'])
+@read_from_replica
 def get_transaction(request, pk):
     """
-    Get a transaction by ID.
+    Get a transaction by ID, live or archived. ?fields= and ?expand=user,merchant apply.
     """
+    fields, expand = get_fieldset(request.query_params)
     try:
-        transaction = Transaction.objects.get(pk=pk)
-        serializer = TransactionSerializer(transaction)
-        return Response(serializer.data)
-    except Transaction.DoesNotExist:
+        serializer = TransactionSerializer(fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
+    serializer.instance = (
+        TransactionSerializer.optimize(Transaction.objects.filter(pk=pk), fields, expand).first()
+        or TransactionSerializer.optimize(ArchivedTransaction.objects.filter(pk=pk), fields, expand).first()
+    )
+    if serializer.instance is None:
         return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(serializer.data)
+
 
 
+def _refund_owner(request):
+    """
+    None for staff, otherwise the requesting user's id: someone else's transaction is reported as not found.
+    """
+    return None if request.user.is_staff else request.user.pk
+
 
 @api_view(['DELETE'])
 def delete_transaction(request, pk):
     """
-    Delete a transaction by ID.
+    Reverse a transaction by ID.
+
+    The row is kept for audit and a refund is recorded instead, so the money
+    goes back to the card and the spend rollups drop it. Staff may reverse
+    any transaction, other users only their own.
     """
     try:
-        transaction = Transaction.objects.get(pk=pk)
-        transaction.delete()
+        refunds.refund(pk, reason='deleted', user_id=_refund_owner(request))
         return Response({'message': 'Transaction deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
     except Transaction.DoesNotExist:
         return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
+    except (refunds.AlreadyRefunded, refunds.NoRefundTarget) as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+
+@api_view(['POST'])
+def refund_transaction(request, pk):
+    """
+    Refund a live or archived transaction to the card it was paid from. Takes an optional reason.
+    Staff may refund any transaction, other users only their own.
+    """
+    try:
+        refund = refunds.refund(pk, reason=str(request.data.get('reason') or '')[:255],
+                                user_id=_refund_owner(request))
+    except Transaction.DoesNotExist:
+        return Response({'error': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
+    except (refunds.AlreadyRefunded, refunds.NoRefundTarget) as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    return Response(RefundSerializer(refund).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+def refund_transactions_bulk(request):
+    """
+    Refund every matching transaction, e.g. all of a merchant's payments in a time window.
+
+    Staff only. Takes merchant and/or date_from/date_to (plus the other
+    list_transactions filters) and an optional reason; already refunded rows are skipped.
+    """
+    if not request.user.is_staff:
+        return Response({'error': 'Staff only.'}, status=status.HTTP_403_FORBIDDEN)
+    params = request.data
+    if not (params.get('merchant') or params.get('date_from') or params.get('date_to')):
+        return Response({'error': 'merchant or a date_from/date_to window is required.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        querysets = [filter_transactions(model.objects.all(), params) for model in (Transaction, ArchivedTransaction)]
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    reason = str(params.get('reason') or '')[:255]
+    return Response({'refunded': sum(refunds.reverse(queryset, reason=reason) for queryset in querysets)})
 
 
 
@@ -323,25 +575,32 @@ def create_merchant_category(request):
 
 
 @api_view(['GET'])
+@catalog_response(CATEGORIES)
 def list_merchant_categories(request):
     """
-    List all Merchant Categories.
+    List all Merchant Categories. ?fields= applies.
     """
-    categories = MerchantCategory.objects.all()
-    serializer = MerchantCategorySerializer(categories, many=True)
+    fields, expand = get_fieldset(request.query_params)
+    try:
+        serializer = MerchantCategorySerializer(catalog.list_categories(), many=True, fields=fields, expand=expand)
+    except ValueError as e:
+        return _bad_request(e)
     return Response(serializer.data)
 
 
 
 @api_view(['GET'])
+@catalog_response(CATEGORIES)
 def get_merchant_category(request, pk):
     """
     Get a Merchant Category by ID.
     """
     try:
-        category = MerchantCategory.objects.get(pk=pk)
-        serializer = MerchantCategorySerializer(category)
+        fields, expand = get_fieldset(request.query_params)
+        serializer = MerchantCategorySerializer(catalog.get_category(pk), fields=fields, expand=expand)
         return Response(serializer.data)
+    except ValueError as e:
+        return _bad_request(e)
     except MerchantCategory.DoesNotExist:
         return Response({'error': 'Merchant Category not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -374,4 +633,105 @@ def delete_merchant_category(request, pk):
         category.delete()
         return Response({'message': 'Merchant Category deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
     except MerchantCategory.DoesNotExist:
-        return Response({'error': 'Merchant Category not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        return Response({'error': 'Merchant Category not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+
+@api_view(['GET'])
+def catalog_stats(request):
+    """
+    Hit/miss counters of the merchant catalogue cache.
+    """
+    return Response(catalog.stats())
+
+
+
+def _date_params(request):
+    """
+    Parse ?date_from=/?date_to= as YYYY-MM-DD. Returns ([date_from, date_to], None) or (None, error response).
+    """
+    dates = []
+    for name in ('date_from', 'date_to'):
+        value = request.query_params.get(name)
+        try:
+            parsed = parse_date(value) if value else None
+        except ValueError:
+            parsed = None
+        if value and parsed is None:
+            return None, Response({'error': f'{name} must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        dates.append(parsed)
+    return dates, None
+
+
+def _spend_response(request, model, field, key):
+    dates, error = _date_params(request)
+    if error:
+        return error
+    return Response(rollups.as_json(rollups.spend(model, field, key, *dates)))
+
+
+@api_view(['GET'])
+@read_from_replica
+def get_user_spend(request, pk):
+    """
+    Daily spend of a user, answered from the rollup table.
+    """
+    return _spend_response(request, UserDailySpend, 'user_id', pk)
+
+
+@api_view(['GET'])
+@read_from_replica
+def get_merchant_spend(request, pk):
+    """
+    Daily takings of a merchant, answered from the rollup table.
+    """
+    return _spend_response(request, MerchantDailySpend, 'merchant_id', pk)
+
+
+@api_view(['GET'])
+@read_from_replica
+def get_merchant_category_spend(request, pk):
+    """
+    Daily takings of a merchant category, answered from the rollup table.
+    """
+    return _spend_response(request, CategoryDailySpend, 'category_id', pk)
+
+
+@api_view(['GET'])
+@read_from_replica
+def get_merchant_statement(request, pk):
+    """
+    Statement of a merchant for date_from..date_to (YYYY-MM-DD, inclusive; defaults to this month).
+
+    Streams NDJSON: the summary (totals, daily breakdown, category share) on
+    the first line, then one line per transaction. ?items=0 returns the summary alone.
+    """
+    dates, error = _date_params(request)
+    if error:
+        return error
+    today = timezone.localdate()
+    date_from, date_to = dates[0] or today.replace(day=1), dates[1] or today
+    if date_from > date_to:
+        return Response({'error': 'date_from must not be after date_to.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        merchant = catalog.get_merchant(pk)
+    except Merchant.DoesNotExist:
+        return Response({'error': 'Merchant not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.query_params.get('items') in ('0', 'false'):
+        return Response(statements.summary(merchant, date_from, date_to))
+    response = StreamingHttpResponse(statements.iter_ndjson(merchant, date_from, date_to),
+                                     content_type='application/x-ndjson')
+    response['Content-Disposition'] = (f'attachment; filename="statement-{merchant.pk}-'
+                                       f'{date_from:%Y%m%d}-{date_to:%Y%m%d}.ndjson"')
+    return response
+
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint, only answered for METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
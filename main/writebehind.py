@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import ledger, rollups
+from .fields import digits_only
+from .metrics import registry
+from .models import LedgerEntry, Transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Optional write-behind path for POST /api/transactions/create/. The request
+# reserves the money (ledger debit and rollups) under a pre-allocated
+# transaction id and appends the full row to a SQLite file on local disk
+# before its database transaction commits. A background writer drains the
+# file into the transactions table in batches. Delivery is at-least-once:
+# rows leave the file only after their INSERT commits, replays are dropped
+# by the primary key, and rows whose reservation never committed are
+# discarded after TRANSACTION_QUEUE_GRACE seconds.
+
+FIELDS = ('id', 'user_id', 'merchant_id', 'amount', 'phone_number', 'transaction_date', 'device_id', 'ip_address')
+
+
+def enabled():
+    return getattr(settings, 'TRANSACTION_WRITE_BEHIND', False) and connection.vendor == 'postgresql'
+
+
+class DurableQueue:
+    """
+    FIFO of JSON payloads in a local SQLite file, fsynced on every put.
+
+    Several threads and processes may share one file; a payload's
+    transaction id is unique, so re-enqueueing the same row is a no-op.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self._db().execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER UNIQUE, '
+            'payload TEXT NOT NULL, enqueued_at REAL NOT NULL)'
+        )
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=FULL')
+        return db
+
+    def put(self, payload):
+        self._db().execute('INSERT OR IGNORE INTO queue (transaction_id, payload, enqueued_at) VALUES (?, ?, ?)',
+                           [payload['id'], json.dumps(payload), time.time()])
+
+    def peek(self, limit, after=0):
+        """
+        Return up to limit (seq, payload, enqueued_at) tuples with seq above after, oldest first,
+        without removing them.
+        """
+        rows = self._db().execute('SELECT seq, payload, enqueued_at FROM queue WHERE seq > ? ORDER BY seq LIMIT ?',
+                                  [after, limit])
+        return [(seq, json.loads(payload), enqueued_at) for seq, payload, enqueued_at in rows]
+
+    def ack(self, seqs):
+        db = self._db()
+        for start in range(0, len(seqs), 500):
+            chunk = seqs[start:start + 500]
+            db.execute(f'DELETE FROM queue WHERE seq IN ({",".join("?" * len(chunk))})', chunk)
+
+    def pending(self):
+        return self._db().execute('SELECT COUNT(*) FROM queue').fetchone()[0]
+
+    def oldest_age(self):
+        oldest = self._db().execute('SELECT MIN(enqueued_at) FROM queue').fetchone()[0]
+        return time.time() - oldest if oldest is not None else 0
+
+
+def reserve(user, merchant, debits, amount, phone_number, device_id, ip_address):
+    """
+    Debit the cards, update the rollups and queue the transaction row. Returns the new transaction id.
+
+    debits is a list of (card_id, amount) as taken by pay(). Raises
+    InsufficientFunds like pay(). The row shows up in the transactions table
+    once the writer flushes it.
+    """
+    with db_transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [Transaction._meta.db_table])
+            transaction_id = cursor.fetchone()[0]
+        now = timezone.now()
+        ledger.lock(card_id for card_id, _ in debits)
+        for card_id, share in debits:
+            ledger.debit(card_id, share, merchant.pk, transaction_id)
+        rollups.apply([rollups.to_row(user.pk, merchant.pk, merchant.category_id, now, amount)])
+        get_queue().put({
+            'id': transaction_id,
+            'user_id': user.pk,
+            'merchant_id': merchant.pk,
+            'amount': str(amount),
+            'phone_number': digits_only(phone_number),
+            'transaction_date': now.isoformat(),
+            'device_id': device_id or '',
+            'ip_address': ip_address,
+        })
+    get_writer().start()
+    return transaction_id
+
+
+def _insert(payloads):
+    """
+    Insert payloads in one statement, skipping ids that are already there.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Transaction._meta.get_field(name).column) for name in FIELDS)
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(FIELDS)) + ')'] * len(payloads))
+    params = []
+    for payload in payloads:
+        params.extend([payload['id'], payload['user_id'], payload['merchant_id'], Decimal(payload['amount']),
+                       payload['phone_number'], parse_datetime(payload['transaction_date']),
+                       payload['device_id'], payload['ip_address']])
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote(Transaction._meta.db_table)} ({columns}) VALUES {placeholders} '
+                       'ON CONFLICT DO NOTHING', params)
+
+
+class Writer:
+    """
+    Background thread that moves queued rows into the transactions table.
+    """
+
+    def __init__(self, queue, batch_size=1000, interval=0.2, grace=300):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.grace = grace
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def flush(self):
+        """
+        Write up to batch_size reserved rows and return how many were inserted.
+
+        Rows whose reservation has not committed (yet) are stepped over rather
+        than waited on, so they never hold up the rows queued behind them.
+        """
+        ready = []
+        aborted = []
+        cutoff = time.time() - self.grace
+        after = 0
+        while len(ready) < self.batch_size:
+            rows = self.queue.peek(self.batch_size, after)
+            if not rows:
+                break
+            ids = [payload['id'] for _, payload, _ in rows]
+            reserved = set(LedgerEntry.objects.filter(transaction_id__in=ids, kind=LedgerEntry.PAYMENT)
+                           .values_list('transaction_id', flat=True))
+            for seq, payload, enqueued_at in rows:
+                if len(ready) == self.batch_size:
+                    break
+                if payload['id'] in reserved:
+                    ready.append((seq, payload))
+                elif enqueued_at < cutoff:
+                    aborted.append(seq)
+            after = rows[-1][0]
+
+        if ready:
+            with db_transaction.atomic():
+                _insert([payload for _, payload in ready])
+        self.queue.ack([seq for seq, _ in ready] + aborted)
+        registry.inc('transaction_queue_flushed_total', None, len(ready),
+                     'Queued transactions written to the database.')
+        if aborted:
+            registry.inc('transaction_queue_aborted_total', None, len(aborted),
+                         'Queued transactions dropped because their reservation rolled back.')
+        return len(ready)
+
+    def drain(self):
+        """
+        Flush until the queue holds nothing that can be written yet. Returns rows inserted.
+        """
+        total = 0
+        while flushed := self.flush():
+            total += flushed
+        return total
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='transaction-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                flushed = self.flush()
+            except Exception:
+                logger.exception('Transaction writer failed to flush; retrying')
+                flushed = 0
+            finally:
+                close_old_connections()
+            if flushed < self.batch_size:
+                self._stop.wait(self.interval)
+
+
+_queue = None
+_writer = None
+_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = DurableQueue(getattr(settings, 'TRANSACTION_QUEUE_PATH',
+                                          os.path.join(settings.BASE_DIR, 'var', 'transaction-queue.sqlite3')))
+        return _queue
+
+
+def get_writer():
+    """
+    Return the process-wide writer built from the TRANSACTION_QUEUE_* settings. It starts on first reserve().
+    """
+    global _writer
+    queue = get_queue()
+    with _lock:
+        if _writer is None:
+            _writer = Writer(
+                queue,
+                batch_size=getattr(settings, 'TRANSACTION_QUEUE_BATCH_SIZE', 1000),
+                interval=getattr(settings, 'TRANSACTION_QUEUE_FLUSH_INTERVAL', 0.2),
+                grace=getattr(settings, 'TRANSACTION_QUEUE_GRACE', 300),
+            )
+        return _writer
+
+
+def backlog():
+    """
+    Return {'pending': rows, 'oldest_seconds': age} for the metrics gauges, zeros when disabled.
+    """
+    if not getattr(settings, 'TRANSACTION_WRITE_BEHIND', False):
+        return {'pending': 0, 'oldest_seconds': 0}
+    queue = get_queue()
+    return {'pending': queue.pending(), 'oldest_seconds': round(queue.oldest_age(), 3)}